@@ -0,0 +1,112 @@
+"""CPU cost per concurrent stream for EchoMond's two playback engines.
+
+Runs N streams side by side the way discord.py's audio player threads do,
+reading every 20 ms frame as fast as possible instead of in real time:
+
+  pcm   FFmpegPCMAudio -> PCMVolumeTransformer -> libopus in Python (legacy)
+  opus  FFmpegOpusAudio, ffmpeg encodes (or copies) Opus itself
+
+CPU time covers this process plus its ffmpeg children, and is reported per
+stream and per second of audio so the two engines compare directly.
+
+Usage: python bench_playback.py [audio_file] [--streams 1 4 8] [--seconds 60]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+import discord
+from discord.opus import Encoder
+
+FRAME_SECONDS = 0.02
+
+
+def make_test_file(seconds):
+    path = os.path.join(tempfile.gettempdir(), f"echomond_bench_{seconds}s.mp3")
+    if not os.path.exists(path):
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-y", "-loglevel", "error",
+             "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+             "-ac", "2", "-ar", "48000", "-b:a", "192k", path],
+            check=True,
+        )
+    return path
+
+
+def drain_pcm(path, volume):
+    source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(path, options="-vn"), volume=volume)
+    encoder = Encoder()
+    frames = 0
+    try:
+        while data := source.read():
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+            frames += 1
+    finally:
+        source.cleanup()
+    return frames
+
+
+def drain_opus(path, volume):
+    options = "-vn" if volume == 1.0 else f"-vn -filter:a volume={volume:.2f}"
+    source = discord.FFmpegOpusAudio(path, options=options)
+    frames = 0
+    try:
+        while source.read():
+            frames += 1
+    finally:
+        source.cleanup()
+    return frames
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run(engine, path, streams, volume):
+    drain = drain_pcm if engine == "pcm" else drain_opus
+    frames = [0] * streams
+
+    def worker(index):
+        frames[index] = drain(path, volume)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(streams)]
+    cpu_before, wall_before = cpu_seconds(), time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cpu = cpu_seconds() - cpu_before
+    wall = time.perf_counter() - wall_before
+    audio_seconds = sum(frames) * FRAME_SECONDS
+    return cpu, wall, audio_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio_file", nargs="?")
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--seconds", type=int, default=60, help="length of the generated test tone")
+    parser.add_argument("--volume", type=float, default=0.8)
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+    path = args.audio_file or make_test_file(args.seconds)
+
+    print(f"🌙 {os.path.basename(path)} at volume {args.volume}")
+    print(f"{'engine':<6} {'streams':>7} {'cpu s':>8} {'wall s':>8} {'cpu s/stream':>13} {'cpu ms/audio s':>15}")
+    for streams in args.streams:
+        for engine in ("pcm", "opus"):
+            cpu, wall, audio_seconds = run(engine, path, streams, args.volume)
+            per_audio = cpu / audio_seconds * 1000 if audio_seconds else float("nan")
+            print(f"{engine:<6} {streams:>7} {cpu:>8.2f} {wall:>8.2f} {cpu / streams:>13.2f} {per_audio:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,37 @@ import discord
 from discord.ext import commands
 import yt_dlp as youtube_dl
 import asyncio
+import aiohttp
+from aiohttp import web
 import random
 import math
 import json
+import logging
+import atexit
+import fcntl
+import sqlite3
+import threading
+import hashlib
+import heapq
+import re
+import shutil
+import signal
+import time
+import uuid
+from contextlib import contextmanager
+from collections import defaultdict, deque, namedtuple, Counter, OrderedDict
+from itertools import islice
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from mutagen.mp3 import MP3
 from mutagen.wave import WAVE
 from discord.ui import View, Select, Button
 from discord import Interaction
-from datetime import datetime
+from datetime import datetime, timezone
 
 # 🌌 EchoMond: Cosmic Edition
 TOKEN = os.getenv("TOKEN")
+STARTED_AT = time.perf_counter()  # time-to-ready is measured from here
 
 intents = discord.Intents.default()
 intents.voice_states = True
@@ -24,8 +44,198 @@ intents.members = True  # Allow tracking for later interaction if needed
 MUSIC_FOLDER = "downloads/"
 os.makedirs(MUSIC_FOLDER, exist_ok=True)
 
+# 🪐 Sharding — one process may run every shard, or launcher.py hands each worker a range
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None  # None lets Discord recommend a count
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", "").split(",") if shard.strip()] or None
+WORKER_ID = os.getenv("WORKER_ID", "0")
+WORKER_COUNT = max(1, int(os.getenv("WORKER_COUNT", "1")))
+
 #☁️ Initialize the bot
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)  # help command disabled
+class EchoMond(commands.AutoShardedBot):
+    async def close(self):
+        """Saves whatever is still waiting on the debounce and closes the upload session before the connection goes."""
+        await library_writer.flush()
+        if upload_session and not upload_session.closed:
+            await upload_session.close()
+        await super().close()
+
+bot = EchoMond(
+    command_prefix="!", intents=intents, help_command=None,  # help command disabled
+    shard_count=SHARD_COUNT, shard_ids=SHARD_IDS,
+)
+
+# 📈 Metrics — Prometheus text format on a local port, for capacity planning
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 turns it off; each launcher worker adds its WORKER_ID
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Metrics:
+    """A small Prometheus registry: counters and histograms keyed by label values.
+
+    Some families are read at scrape time instead (``collect``), so numbers
+    the bot already keeps, like progress edits or queue lengths, cost nothing
+    until someone asks. Library saves observe from an executor thread, so
+    updates take a lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}  # {name: (kind, help, label_names, buckets or read function)}
+        self.series = defaultdict(dict)  # {name: {label_values: count, or [bucket_counts, sum, count]}}
+        self.runner = None
+
+    def counter(self, name, help, labels=()):
+        self.families[name] = ("counter", help, labels, None)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.families[name] = ("histogram", help, labels, buckets)
+
+    def collect(self, name, help, kind, labels, read):
+        """Registers a counter or gauge whose ``{label_values: value}`` comes from ``read()`` at scrape time."""
+        self.families[name] = (kind, help, labels, read)
+
+    def inc(self, name, *labels, amount=1):
+        with self.lock:
+            series = self.series[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, value, *labels):
+        buckets = self.families[name][3]
+        with self.lock:
+            series = self.series[name].get(labels)
+            if series is None:
+                series = self.series[name][labels] = [[0] * (len(buckets) + 1), 0.0, 0]
+            series[0][bisect_left(buckets, value)] += 1  # the last slot is +Inf
+            series[1] += value
+            series[2] += 1
+
+    @staticmethod
+    def _labels(names, values, extra=""):
+        pairs = []
+        for name, value in zip(names, values):
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{name}="{value}"')
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @staticmethod
+    def _number(value):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value) if isinstance(value, float) else str(value)
+
+    def render(self):
+        with self.lock:
+            snapshot = {
+                name: {labels: [list(value[0]), value[1], value[2]] if isinstance(value, list) else value
+                       for labels, value in series.items()}
+                for name, series in self.series.items()
+            }
+        lines = []
+        for name, (kind, help, label_names, extra) in self.families.items():
+            if callable(extra):
+                try:
+                    series = extra()
+                except Exception as e:
+                    print(f"[Metrics] Could not read {name}: {e}")
+                    continue
+            else:
+                series = snapshot.get(name, {})
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series.items():
+                if kind != "histogram":
+                    lines.append(f"{name}{self._labels(label_names, labels)} {self._number(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket in zip(extra + (math.inf,), counts):
+                    cumulative += bucket
+                    le = f'le="{self._number(float(bound))}"'
+                    lines.append(f"{name}_bucket{self._labels(label_names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(label_names, labels)} {self._number(total)}")
+                lines.append(f"{name}_count{self._labels(label_names, labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, request):
+        return web.Response(
+            body=self.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def start(self):
+        """Serves /metrics once; a taken port is logged, never fatal."""
+        if self.runner or not METRICS_PORT:
+            return
+        port = METRICS_PORT + int(WORKER_ID)
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, METRICS_HOST, port).start()
+        except OSError as e:
+            print(f"[Metrics] Could not listen on {METRICS_HOST}:{port}: {e}")
+            await runner.cleanup()
+            return
+        self.runner = runner
+        print(f"[Metrics] 📈 Serving http://{METRICS_HOST}:{port}/metrics")
+
+metrics = Metrics()
+metrics.histogram("echomond_command_seconds", "Time from a command's invocation to its return.", ("command",))
+metrics.counter("echomond_commands_total", "Commands run, by outcome.", ("command", "outcome"))
+metrics.counter("echomond_guild_busy_seconds_total", "Command and yt_dlp time spent on behalf of each guild.", ("guild",))
+metrics.histogram("echomond_ytdl_wait_seconds", "Time a yt_dlp call waited for a worker slot.", ("kind",))
+metrics.histogram("echomond_ytdl_seconds", "yt_dlp resolve and download time inside the worker pool.", ("kind",))
+metrics.counter("echomond_ytdl_failures_total", "yt_dlp calls that raised.", ("kind",))
+metrics.histogram("echomond_ttfa_seconds", "Time from dequeuing a track to its first audio frame.", ("mode",))
+metrics.histogram("echomond_transition_seconds", "Silence between one track's last frame and the next one's first.")
+metrics.histogram("echomond_handoff_seconds", "Time from the audio thread signalling a track's end to the player acting on it.")
+metrics.histogram("echomond_library_save_seconds", "Library save time: snapshot on the loop, write off it.", ("stage",))
+metrics.counter("echomond_library_save_failures_total", "Guild library writes that failed and were retried.")
+metrics.collect("echomond_progress_edits_total", "Now-playing progress edits sent.", "counter", (), lambda: {(): progress.edits})
+metrics.collect("echomond_progress_throttled_total", "Progress edits discord.py held back for a rate-limit bucket.", "counter", (), lambda: {(): progress.throttled})
+metrics.collect("echomond_progress_rate_limited_total", "Message edits answered with HTTP 429.", "counter", (), lambda: {(): progress.rate_limited})
+metrics.collect(
+    "echomond_discord_rate_limited_total", "HTTP 429s discord.py waited out, by route.", "counter", ("route",),
+    lambda: {(route,): count for route, count in rate_limits.by_route.items()},
+)
+metrics.collect(
+    "echomond_queue_length", "Tracks waiting in each active player's queue.", "gauge", ("guild",),
+    lambda: {(str(guild_id),): len(player.queue) for guild_id, player in players.items()},
+)
+metrics.collect("echomond_players", "Guild players held in memory.", "gauge", (), lambda: {(): len(players)})
+metrics.collect(
+    "echomond_voice_clients", "Voice connections on each shard this process runs.", "gauge", ("shard",),
+    lambda: {
+        **{(str(shard_id),): 0 for shard_id in bot.shards},
+        **Counter((str(vc.guild.shard_id),) for vc in bot.voice_clients),
+    },
+)
+metrics.collect(
+    "echomond_shard_latency_seconds", "Gateway heartbeat latency per shard.", "gauge", ("shard",),
+    lambda: {(str(shard_id),): shard.latency for shard_id, shard in bot.shards.items()},
+)
+metrics.collect(
+    "echomond_voice_connections", "Connected voice clients, active (playing) or idle.", "gauge", ("state",),
+    lambda: {(state,): count for state, count in voice_supervisor.counts().items()},
+)
+metrics.collect(
+    "echomond_voice_idle_leaves_total", "Channels left for sitting empty or silent.", "counter", ("reason",),
+    lambda: {(reason,): count for reason, count in voice_supervisor.disconnects.items()},
+)
+metrics.collect(
+    "echomond_voice_disconnects_total", "Voice disconnects, by how they ended.", "counter", ("outcome",),
+    lambda: {(outcome,): count for outcome, count in voice_reaper.totals.items()},
+)
+metrics.collect("echomond_janitor_reclaimed_bytes_total", "Bytes the janitor freed in downloads/.", "counter", (), lambda: {(): janitor.reclaimed_bytes})
+metrics.collect(
+    "echomond_time_to_ready_seconds", "Seconds from process start to the first on_ready.", "gauge", (),
+    lambda: {(): bot.time_to_ready} if getattr(bot, "time_to_ready", None) is not None else {},
+)
 
 # 🌒 YouTube download config (rare use, but kept for edge cases)
 cookies_path = "/app/cookies.txt"
@@ -52,65 +262,1946 @@ YDL_OPTIONS = {
     },
 }
 
+# 🛰️ yt_dlp worker pool — resolves and downloads drift off the event loop
+YTDL_POOL = os.getenv("YTDL_POOL", "thread")  # "thread" or "process"
+YTDL_MAX_WORKERS = int(os.getenv("YTDL_MAX_WORKERS", "4"))
+YTDL_PER_GUILD_LIMIT = int(os.getenv("YTDL_PER_GUILD_LIMIT", "2"))
+
+def _ytdl_extract(url, download, options):
+    """Blocking yt_dlp call; runs inside a pool worker, never on the event loop."""
+    with youtube_dl.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=download)
+        if info is None:
+            raise RuntimeError(f"No information found for {url}")
+        filepath = None
+        if download:
+            filepath = info['requested_downloads'][0]['filepath'] if 'requested_downloads' in info else ydl.prepare_filename(info)
+        info = ydl.sanitize_info(info)
+        info['_filepath'] = filepath
+        return info
+
+class YTDLService:
+    """Shares a bounded pool of yt_dlp workers fairly between guilds.
+
+    Every call first takes one of its guild's slots, then one of the global
+    slots, so a guild can never hold more than ``per_guild_limit`` workers and
+    a 200-track playlist only ever waits in line beside everyone else.
+    """
+
+    def __init__(self, max_workers, per_guild_limit, pool="thread"):
+        self.max_workers = max(1, max_workers)
+        self.per_guild_limit = max(1, min(per_guild_limit, self.max_workers))
+        if pool == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ytdl")
+        self.global_slots = asyncio.Semaphore(self.max_workers)
+        self.guild_slots = {}  # {guild_id: [semaphore, waiting_calls]}
+
+    async def extract(self, guild_id, url, download=False, options=None):
+        kind = "download" if download else "resolve"
+        slot = self.guild_slots.setdefault(guild_id, [asyncio.Semaphore(self.per_guild_limit), 0])
+        slot[1] += 1
+        queued_at = time.perf_counter()
+        try:
+            async with slot[0], self.global_slots:
+                started = time.perf_counter()
+                metrics.observe("echomond_ytdl_wait_seconds", started - queued_at, kind)
+                loop = asyncio.get_running_loop()
+                try:
+                    return await loop.run_in_executor(
+                        self.executor, _ytdl_extract, url, download, options or YDL_OPTIONS
+                    )
+                except Exception:
+                    metrics.inc("echomond_ytdl_failures_total", kind)
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - started
+                    metrics.observe("echomond_ytdl_seconds", elapsed, kind)
+                    metrics.inc("echomond_guild_busy_seconds_total", str(guild_id), amount=elapsed)
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                self.guild_slots.pop(guild_id, None)
+
+ytdl = YTDLService(YTDL_MAX_WORKERS, YTDL_PER_GUILD_LIMIT, YTDL_POOL)
+
+# 🌌 Playlists are listed flat first, then each star is resolved in the background
+YDL_FLAT_OPTIONS = {**YDL_OPTIONS, 'extract_flat': 'in_playlist'}
+PLAYLIST_RESOLVE_CONCURRENCY = int(os.getenv("PLAYLIST_RESOLVE_CONCURRENCY", "4"))
+PLAYLIST_PROGRESS_INTERVAL = 5  # seconds between progress message edits
+
+# 💾 Audio cache — YouTube echoes kept on disk, keyed by video ID and format
+# Each worker process owns its own folder and an equal share of the budget, so
+# pins and evictions never reach across processes.
+
+AUDIO_CACHE_ROOT = os.path.join(MUSIC_FOLDER, "cache")
+AUDIO_CACHE_FOLDER = os.path.join(AUDIO_CACHE_ROOT, f"worker-{WORKER_ID}")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3))) // WORKER_COUNT
+AUDIO_CACHE_MAX_ENTRIES = max(1, int(os.getenv("AUDIO_CACHE_MAX_ENTRIES", "500")) // WORKER_COUNT)
+AUDIO_CACHE_ORPHAN_GRACE = 600  # seconds; a younger file may still be mid-download
+AUDIO_CACHE_FORMAT = "bestaudio"  # YouTube's own audio, kept as downloaded; older mp3-192 entries age out
+YDL_CACHE_OPTIONS = {
+    **{key: value for key, value in YDL_OPTIONS.items() if key != 'postprocessors'},
+    'format': 'bestaudio[acodec=opus]/bestaudio/best',  # Opus when offered, so playback can copy it
+    'outtmpl': f'{AUDIO_CACHE_FOLDER}/%(id)s.{AUDIO_CACHE_FORMAT}.%(ext)s',
+}
+os.makedirs(AUDIO_CACHE_FOLDER, exist_ok=True)
+
+def retired_cache_folders():
+    """Cache folders of worker ids beyond the current WORKER_COUNT, left by a run with more workers."""
+    retired = []
+    for name in os.listdir(AUDIO_CACHE_ROOT):
+        worker = name.removeprefix("worker-")
+        if name.startswith("worker-") and worker.isdigit() and int(worker) >= WORKER_COUNT:
+            retired.append(os.path.join(AUDIO_CACHE_ROOT, name))
+    return retired
+
+YOUTUBE_ID_PATTERN = re.compile(
+    r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([A-Za-z0-9_-]{11})"
+)
+
+def youtube_video_id(url):
+    match = YOUTUBE_ID_PATTERN.search(url or "")
+    return match.group(1) if match else None
+
+class AudioCache:
+    """Least-recently-used cache of downloaded tracks with a byte and entry budget.
+
+    Each entry is an audio file named ``<video_id>.<format>.<ext>`` plus a
+    ``.json`` sidecar holding its title, duration and codec, so the folder itself is
+    the index and can be rebuilt at startup. Entries that are playing are
+    pinned and never evicted.
+    """
+
+    def __init__(self, folder, fmt, max_bytes, max_entries):
+        self.folder = folder
+        self.format = fmt
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # {key: {"path", "size", "title", "duration", "codec"}}, oldest first
+        self.total_bytes = 0
+        self.pinned = defaultdict(int)
+
+    def key(self, video_id):
+        return f"{video_id}.{self.format}"
+
+    def _sidecar(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def reconcile(self):
+        """Rebuilds the index from disk, dropping partial downloads and orphaned files."""
+        self.entries.clear()
+        self.total_bytes = 0
+        audio, sidecars = {}, {}
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            parts = name.split(".")
+            if len(parts) == 3 and parts[1] == self.format and parts[2] == "json":
+                sidecars[f"{parts[0]}.{parts[1]}"] = path
+            elif len(parts) == 3 and parts[1] == self.format and parts[2] not in ("part", "ytdl", "temp"):
+                audio[f"{parts[0]}.{parts[1]}"] = path
+            elif time.time() - os.path.getmtime(path) > AUDIO_CACHE_ORPHAN_GRACE:
+                self._remove(path)
+
+        found = []
+        for key, path in audio.items():
+            try:
+                with open(sidecars.pop(key)) as f:
+                    meta = json.load(f)
+                stat = os.stat(path)
+            except (KeyError, OSError, ValueError):
+                if os.path.exists(path) and time.time() - os.path.getmtime(path) > AUDIO_CACHE_ORPHAN_GRACE:
+                    self._remove(path)
+                continue
+            found.append((stat.st_mtime, key, {
+                "path": path,
+                "size": stat.st_size,
+                "title": meta.get("title"),
+                "duration": int(meta.get("duration") or 0),
+                "codec": meta.get("codec"),
+            }))
+        for path in sidecars.values():
+            if time.time() - os.path.getmtime(path) > AUDIO_CACHE_ORPHAN_GRACE:
+                self._remove(path)
+
+        for _, key, entry in sorted(found, key=lambda item: item[0]):
+            self.entries[key] = entry
+            self.total_bytes += entry["size"]
+        self.evict()
+        print(f"[Cache] 💾 {len(self.entries)} cached echoes ({self.total_bytes // (1024 * 1024)} MiB) found on disk.")
+
+    def get(self, video_id):
+        key = self.key(video_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if not os.path.exists(entry["path"]):
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        try:
+            os.utime(entry["path"])  # mtime carries recency across restarts
+        except OSError:
+            pass
+        return entry
+
+    def add(self, video_id, path, title, duration, codec=None):
+        key = self.key(video_id)
+        if key in self.entries:
+            self._drop(key, delete=False)
+        entry = {"path": path, "size": os.path.getsize(path), "title": title, "duration": int(duration or 0), "codec": codec}
+        with open(self._sidecar(key), "w") as f:
+            json.dump({"title": title, "duration": entry["duration"], "codec": codec}, f)
+        self.entries[key] = entry
+        self.total_bytes += entry["size"]
+        self.evict()
+        return entry
+
+    def tracked_paths(self):
+        """Every file the index accounts for: each entry's audio and its sidecar."""
+        return {os.path.abspath(path) for key, entry in self.entries.items() for path in (entry["path"], self._sidecar(key))}
+
+    def pin(self, video_id):
+        self.pinned[self.key(video_id)] += 1
+
+    def unpin(self, video_id):
+        key = self.key(video_id)
+        self.pinned[key] -= 1
+        if self.pinned[key] <= 0:
+            del self.pinned[key]
+            self.evict()
+
+    def trim(self, needed):
+        """Evicts least-recently-used entries until ``needed`` bytes are freed; returns the bytes freed."""
+        freed = 0
+        for key in list(self.entries):
+            if freed >= needed:
+                break
+            if key not in self.pinned:
+                freed += self.entries[key]["size"]
+                self._drop(key)
+        return freed
+
+    def evict(self):
+        for key in list(self.entries):
+            if self.total_bytes <= self.max_bytes and len(self.entries) <= self.max_entries:
+                break
+            if key not in self.pinned:
+                self._drop(key)
+
+    def _drop(self, key, delete=True):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry["size"]
+        if delete:
+            self._remove(entry["path"])
+            self._remove(self._sidecar(key))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[Cache Error] Could not delete {path}: {e}")
+
+audio_cache = AudioCache(AUDIO_CACHE_FOLDER, AUDIO_CACHE_FORMAT, AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_MAX_ENTRIES)
+
+# 🔭 Lookahead — the next few YouTube echoes are warmed into the cache while one plays
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "2"))
+
+class Prefetcher:
+    """Downloads upcoming queue entries into the audio cache, one guild task at a time.
+
+    Downloads are shared by video ID, so ``resolve_track`` can await a fetch the
+    prefetcher already started. Cancelling a guild's lookahead (shuffle,
+    clear, stop) never cancels a shared download; it only stops the guild
+    from starting new ones.
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.tasks = {}      # {guild_id: lookahead task}
+        self.inflight = {}   # {video_id: download task}
+
+    def is_fetching(self, video_id):
+        return video_id in self.inflight
+
+    async def fetch(self, guild_id, url, title, video_id):
+        task = self.inflight.get(video_id)
+        if task is None:
+            task = bot.loop.create_task(self._download(guild_id, url, title, video_id))
+            self.inflight[video_id] = task
+            task.add_done_callback(lambda _: self.inflight.pop(video_id, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, guild_id, url, title, video_id):
+        info = await ytdl.extract(guild_id, url, download=True, options=YDL_CACHE_OPTIONS)
+        stream_failures.pop(url, None)
+        return audio_cache.add(video_id, info['_filepath'], title, info.get('duration'), info.get('acodec'))
+
+    def schedule(self, guild_id):
+        """Restarts the lookahead for the current head of the guild's queue."""
+        self.cancel(guild_id)
+        targets = []
+        player = players.peek(guild_id)
+        for song in player.queue[:self.depth] if player else ():
+            if isinstance(song, RemoteTrack):
+                video_id = youtube_video_id(song.url)
+                if video_id and not audio_cache.get(video_id):
+                    targets.append((song.url, song.title, video_id))
+        if targets:
+            task = bot.loop.create_task(self._run(guild_id, targets))
+            self.tasks[guild_id] = task
+            task.add_done_callback(lambda done: self.tasks.pop(guild_id, None) if self.tasks.get(guild_id) is done else None)
+
+    def cancel(self, guild_id):
+        task = self.tasks.pop(guild_id, None)
+        if task:
+            task.cancel()
+
+    async def _run(self, guild_id, targets):
+        for url, title, video_id in targets:
+            try:
+                await self.fetch(guild_id, url, title, video_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Prefetch] Could not warm {url}: {e}")
+
+prefetcher = Prefetcher(PREFETCH_DEPTH)
+
 # 🔊 FFmpeg configs for local vs streamed
 FFMPEG_OPTIONS = {
-    'options': '-vn -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+    'before_options': '-nostdin -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+    'options': '-vn'
 }
 FFMPEG_LOCAL_OPTIONS = {
     'before_options': '-nostdin',
     'options': '-vn'
 }
 
+# 🌊 Streaming playback — direct audio URLs go straight into ffmpeg
+YTDL_STREAM = os.getenv("YTDL_STREAM", "1") != "0"
+YDL_STREAM_OPTIONS = {
+    **{key: value for key, value in YDL_OPTIONS.items() if key != 'postprocessors'},
+    'format': 'bestaudio/best',
+}
+STREAM_FAILURE_TTL = int(os.getenv("STREAM_FAILURE_TTL", "3600"))  # seconds a failed URL is downloaded instead
+STREAM_FAILURE_MAX = 1000
+stream_failures = OrderedDict()  # {url: monotonic time its stream failed}, oldest first
+
+def note_stream_failure(url):
+    stream_failures.pop(url, None)
+    stream_failures[url] = time.monotonic()
+    while len(stream_failures) > STREAM_FAILURE_MAX:
+        stream_failures.popitem(last=False)
+
+def stream_recently_failed(url):
+    """Whether the URL's stream failed within STREAM_FAILURE_TTL; a CDN hiccup shouldn't last forever."""
+    failed_at = stream_failures.get(url)
+    if failed_at is None:
+        return False
+    if time.monotonic() - failed_at > STREAM_FAILURE_TTL:
+        del stream_failures[url]
+        return False
+    return True
+
+class FirstFrameProbe(discord.AudioSource):
+    """Passes audio through untouched, counting frames and reporting the first one."""
+
+    def __init__(self, original, on_first_frame=None):
+        self.original = original
+        self.on_first_frame = on_first_frame
+        self.started = False
+        self.frames = 0
+        self.superseded = False  # set when the source is swapped out mid-track
+
+    def read(self):
+        data = self.original.read()
+        if data:
+            self.frames += 1
+            if not self.started:
+                self.started = True
+                if self.on_first_frame:
+                    self.on_first_frame()
+        return data
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        self.original.cleanup()
+
+def record_ttfa(mode, started_at):
+    elapsed = time.perf_counter() - started_at
+    metrics.observe("echomond_ttfa_seconds", elapsed, mode)
+    print(f"[TTFA] {mode}: {elapsed:.2f}s")
+
+# ⏱️ Track transitions — how long the silence between two songs lasts
+TRANSITION_WARN_SECONDS = float(os.getenv("TRANSITION_WARN_SECONDS", "1.5"))
+
+def record_transition(guild_id, ended_at):
+    gap = time.perf_counter() - ended_at
+    metrics.observe("echomond_transition_seconds", gap)
+    if gap > TRANSITION_WARN_SECONDS:
+        print(f"[Transition] 🐢 Guild {guild_id} took {gap:.2f}s from track end to next audio.")
+
+# 🎛️ Playback engine — "opus" lets ffmpeg encode (or copy) Opus, "pcm" is the legacy Python path
+PLAYBACK_ENGINE = os.getenv("PLAYBACK_ENGINE", "opus")
+FRAME_SECONDS = 0.02  # every voice frame is 20 ms
+
+async def create_audio_source(url, ffmpeg_options, volume, codec=None, offset=0.0):
+    """Builds the ffmpeg source for a track, starting ``offset`` seconds in.
+
+    In the Opus engine the volume becomes an ffmpeg filter, and sources that
+    are already Opus at full volume are copied through without re-encoding.
+    ``codec`` is the known source codec; when unknown, ffprobe decides.
+    """
+    before_options = ffmpeg_options.get('before_options', '')
+    if offset:
+        before_options = f"{before_options} -ss {offset:.2f}"
+    options = ffmpeg_options.get('options', '')
+
+    if PLAYBACK_ENGINE == "pcm":
+        source = discord.FFmpegPCMAudio(url, before_options=before_options, options=options)
+        return discord.PCMVolumeTransformer(source, volume=volume)
+
+    if volume != 1.0:
+        return discord.FFmpegOpusAudio(url, before_options=before_options, options=f"{options} -filter:a volume={volume:.2f}")
+    if codec == "opus":
+        return discord.FFmpegOpusAudio(url, codec="opus", before_options=before_options, options=options)
+    if codec:
+        return discord.FFmpegOpusAudio(url, before_options=before_options, options=options)
+    return await discord.FFmpegOpusAudio.from_probe(url, method="fallback", before_options=before_options, options=options)
+
+def guild_volume(guild_id):
+    player = players.peek(guild_id)
+    return player.volume if player else 1.0
+
+async def start_track_source(vc, guild_id, track, offset=0.0, on_first_frame=None):
+    source = await create_audio_source(
+        track["url"], track["ffmpeg_options"], guild_volume(guild_id), track["codec"], offset
+    )
+    probe = FirstFrameProbe(source, on_first_frame)
+    track["probe"], track["offset"] = probe, offset
+    vc.play(probe, after=lambda error: track["after"](error, probe))
+
+async def apply_volume(vc, guild_id, track):
+    """Applies the guild's stored volume to the track that is playing."""
+    if not track["probe"]:
+        return
+    if PLAYBACK_ENGINE == "pcm":
+        track["probe"].original.volume = guild_volume(guild_id)
+        return
+
+    # Opus frames can't be scaled in Python, so ffmpeg restarts where we left off with the new filter
+    old = track["probe"]
+    position = track["offset"] + old.frames * FRAME_SECONDS
+    was_paused = vc.is_paused()
+    old.superseded = True
+    vc.stop()
+    await start_track_source(vc, guild_id, track, position)
+    if was_paused:
+        vc.pause()
+
+def track_position(track):
+    """Seconds of the track actually played, counted from the frames sent."""
+    probe = track["probe"]
+    return track["offset"] + (probe.frames * FRAME_SECONDS if probe else 0)
+
+# 🌗 Now-playing progress — one shared timer edits every guild's embed
+PROGRESS_BASE_INTERVAL = int(os.getenv("PROGRESS_BASE_INTERVAL", "10"))
+PROGRESS_EDITS_PER_SECOND = float(os.getenv("PROGRESS_EDITS_PER_SECOND", "4"))
+PROGRESS_THROTTLED_SECONDS = 1.0  # an edit slower than this was held back by a rate limit
+PROGRESS_FADE_SECONDS = 6
+
+def cosmic_progress_bar(current, total, segments=10):
+    moon_phases = ["🌑", "🌒", "🌓", "🌔", "🌕", "🌖", "🌗", "🌘", "🌑", "🌑"]
+    filled = int((current / total) * segments) if total else 0
+    return ''.join(moon_phases[i] if i < filled else "🌑" for i in range(segments))
+
+def format_progress(second, duration):
+    return f"{second // 60}:{second % 60:02d} / {duration // 60}:{duration % 60:02d}"
+
+class ProgressScheduler:
+    """Owns every active now-playing message and edits them from one timer.
+
+    Each message waits in a heap keyed on the second it is next due, so any
+    delay fits, however long the interval grows. The
+    per-message interval stretches with the number of playing guilds so the
+    total stays under PROGRESS_EDITS_PER_SECOND, doubles for a message whose
+    edits come back slowly, and everything pauses for the Retry-After of a 429.
+
+    discord.py waits out 429s inside ``edit`` and only logs them, so
+    RateLimitMonitor reports each one on a message edit (``rate_limited``)
+    and pauses everything for its Retry-After. An edit that took longer than
+    PROGRESS_THROTTLED_SECONDS counts as ``throttled`` and backs its message
+    off by at least that long.
+    """
+
+    def __init__(self, base_interval, edits_per_second):
+        self.base_interval = base_interval
+        self.edits_per_second = edits_per_second
+        self.deadlines = []        # heap of (due tick, message_id)
+        self.entries = {}          # {message_id: entry}
+        self.active_by_guild = {}  # {guild_id: message_id of the track that is playing}
+        self.tick = 0
+        self.task = None
+        self.paused_until = 0.0
+        self.edits = 0
+        self.throttled = 0
+        self.rate_limited = 0
+
+    def interval(self):
+        spread = math.ceil(len(self.active_by_guild) / self.edits_per_second)
+        return max(self.base_interval, spread)
+
+    def start(self, guild_id, message, embed, title, duration, track):
+        self.stop(guild_id)
+        self.entries[message.id] = {
+            "guild_id": guild_id,
+            "message": message,
+            "embed": embed,
+            "title": title,
+            "duration": duration,
+            "track": track,
+            "state": "playing",
+            "backoff": 1,
+            "busy": False,
+            "dirty": False,
+            "shown": None,
+        }
+        self.active_by_guild[guild_id] = message.id
+        self._schedule(message.id, self.interval())
+
+    def finish(self, guild_id, track):
+        """Called when a track ends; fades out if it played through, rests if it was cut short."""
+        key = self.active_by_guild.get(guild_id)
+        if key is None or self.entries[key]["track"] is not track:
+            return
+        entry = self.entries[key]
+        played_through = entry["duration"] - track_position(track) <= 2
+        self._end(guild_id, "fade" if played_through else "rest")
+
+    def stop(self, guild_id):
+        """Ends the guild's progress updates right away (skip, stop, next track)."""
+        if guild_id in self.active_by_guild:
+            self._end(guild_id, "rest")
+
+    def _end(self, guild_id, state):
+        key = self.active_by_guild.pop(guild_id)
+        self.entries[key]["state"] = state
+        bot.loop.create_task(self._edit(key))
+
+    def _schedule(self, key, delay):
+        entry = self.entries[key]
+        entry["due"] = self.tick + max(1, math.ceil(delay))
+        heapq.heappush(self.deadlines, (entry["due"], key))
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self._run())
+
+    async def _run(self):
+        next_tick = bot.loop.time()
+        while self.entries:
+            next_tick += 1
+            await asyncio.sleep(max(0.0, next_tick - bot.loop.time()))
+            self.tick += 1
+            due = set()
+            while self.deadlines and self.deadlines[0][0] <= self.tick:
+                tick, key = heapq.heappop(self.deadlines)
+                if key in self.entries and self.entries[key]["due"] == tick:  # else it was rescheduled
+                    due.add(key)
+            wait = self.paused_until - bot.loop.time()
+            for key in due:
+                if wait > 0:
+                    self._schedule(key, wait)
+                else:
+                    bot.loop.create_task(self._edit(key))
+
+    def _render(self, entry):
+        embed, state = entry["embed"], entry["state"]
+        if state == "playing":
+            duration = entry["duration"]
+            second = min(int(track_position(entry["track"])), duration)
+            return f"{cosmic_progress_bar(second, duration)} `{format_progress(second, duration)}`"
+        if state == "fade":
+            embed.title = "🌌 Fadeout"
+            embed.description = f"**{entry['title']}** drifts into cosmic silence."
+            return "🌕🌕🌕🌕🌕🌕🌕🌕🌕🌕 `Finished`"
+        if state == "complete":
+            return "🌙 The glow fades gently... `Complete`"
+        return "🌑 Echo rests. `Complete`"
+
+    async def _edit(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        if entry["busy"]:
+            entry["dirty"] = True
+            return
+        entry["busy"] = True
+        state = entry["state"]
+        value = self._render(entry)
+        retry_after = None
+        if value != entry["shown"]:  # a paused track doesn't need the same bar twice
+            sent_at = bot.loop.time()
+            try:
+                entry["embed"].set_field_at(0, name="Progress", value=value, inline=False)
+                await entry["message"].edit(embed=entry["embed"])
+                self.edits += 1
+                entry["shown"] = value
+                waited = bot.loop.time() - sent_at
+                if waited > PROGRESS_THROTTLED_SECONDS:  # discord.py slept out this channel's bucket
+                    self.throttled += 1
+                    entry["backoff"] = min(max(entry["backoff"] * 2, math.ceil(waited / self.interval())), 6)
+                else:
+                    entry["backoff"] = max(1, entry["backoff"] // 2)
+            except discord.NotFound:
+                self._forget(key)  # the message was deleted; nothing left to edit
+                return
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    retry_after = float(e.response.headers.get("Retry-After", 5))
+        entry["busy"] = False
+
+        if retry_after:
+            self.note_rate_limit(retry_after)
+
+        if entry["dirty"] or entry["state"] != state:
+            entry["dirty"] = False
+            bot.loop.create_task(self._edit(key))
+        elif state == "playing":
+            self._schedule(key, retry_after or self.interval() * entry["backoff"])
+        elif state == "fade":
+            entry["state"] = "complete"
+            self._schedule(key, PROGRESS_FADE_SECONDS)
+        else:
+            self._forget(key)
+
+    def note_rate_limit(self, retry_after):
+        """A message edit drew a 429; hold every progress edit for its Retry-After."""
+        self.rate_limited += 1
+        self.paused_until = max(self.paused_until, bot.loop.time() + retry_after)
+
+    def _forget(self, key):
+        entry = self.entries.pop(key, None)
+        if entry and self.active_by_guild.get(entry["guild_id"]) == key:
+            del self.active_by_guild[entry["guild_id"]]
+
+progress = ProgressScheduler(PROGRESS_BASE_INTERVAL, PROGRESS_EDITS_PER_SECOND)
+
+# ⏳ Rate limits — discord.py sleeps through every 429 itself and only logs it, so we listen to the log
+class RateLimitMonitor(logging.Handler):
+    """Counts the 429s discord.py logs, by route, and pauses progress edits when a message edit draws one."""
+
+    LOGGED = re.compile(r"(\w+) (\S+) responded with 429\. Retrying in ([\d.]+) seconds")
+    SNOWFLAKE = re.compile(r"/\d{15,}")
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.by_route = Counter()  # {"PATCH /channels/{id}/messages/{id}": count}
+
+    def emit(self, record):
+        try:
+            match = self.LOGGED.search(record.getMessage())
+            if not match:
+                return
+            method, url, retry_after = match.group(1), match.group(2), float(match.group(3))
+            path = re.sub(r"^https?://[^/]+/api/v\d+", "", url.split("?")[0])
+            route = f"{method} {self.SNOWFLAKE.sub('/{id}', path)}"
+            self.by_route[route] += 1
+            if route == "PATCH /channels/{id}/messages/{id}":
+                progress.note_rate_limit(retry_after)
+        except Exception:
+            self.handleError(record)
+
+rate_limits = RateLimitMonitor()
+logging.getLogger("discord.http").addHandler(rate_limits)
+
+# 🏷️ Tag index — every guild's tags, kept both ways so queries never scan the library
+class TagIndex:
+    """Maps tracks to their tags and tags to their tracks.
+
+    Both directions are insertion-ordered sets (dict keys), updated together
+    on every tag, untag and delete, so a lookup or query costs the size of
+    its answer. Tags are stored lowercase.
+    """
+
+    def __init__(self, file_tags=None, files=None):
+        self.tags_by_file = {}  # {filename: {tag: None}}
+        self.files_by_tag = {}  # {tag: {filename: None}}
+        known = set(files) if files is not None else None
+        for filename, tags in (file_tags or {}).items():
+            if known is None or filename in known:
+                self.add(filename, tags)
+
+    def add(self, filename, tags):
+        """Tags a track; returns the tags it didn't carry before."""
+        current = self.tags_by_file.setdefault(filename, {})
+        added = []
+        for tag in tags:
+            tag = tag.lower()
+            if tag not in current:
+                current[tag] = None
+                self.files_by_tag.setdefault(tag, {})[filename] = None
+                added.append(tag)
+        return added
+
+    def clear(self, filename):
+        """Removes every tag from a track; returns whether it had any."""
+        tags = self.tags_by_file.pop(filename, None)
+        for tag in tags or ():
+            files = self.files_by_tag[tag]
+            del files[filename]
+            if not files:
+                del self.files_by_tag[tag]
+        return bool(tags)
+
+    def remove_tag(self, tag):
+        """Removes a tag from every track; returns the tracks that carried it."""
+        files = self.files_by_tag.pop(tag.lower(), {})
+        for filename in files:
+            del self.tags_by_file[filename][tag.lower()]
+        return list(files)
+
+    def all_tags(self):
+        return list(self.files_by_tag)
+
+    def files_with(self, tag):
+        return list(self.files_by_tag.get(tag.lower(), ()))
+
+    def query(self, any_of=(), all_of=(), none_of=(), universe=()):
+        """Tracks with every tag in ``all_of``, at least one in ``any_of`` and none in ``none_of``.
+
+        The smallest required tag drives an AND; ``universe`` (the whole
+        library) is only walked for a query made of exclusions alone.
+        """
+        required = [self.files_by_tag.get(tag.lower(), {}) for tag in all_of]
+        optional = [self.files_by_tag.get(tag.lower(), {}) for tag in any_of]
+        excluded = [self.files_by_tag.get(tag.lower(), {}) for tag in none_of]
+
+        if required:
+            candidates = (f for f in min(required, key=len) if all(f in files for files in required))
+            if optional:
+                candidates = (f for f in candidates if any(f in files for files in optional))
+        elif optional:
+            candidates = dict.fromkeys(f for files in optional for f in files)
+        else:
+            candidates = dict.fromkeys(universe)
+        return [f for f in candidates if not any(f in files for files in excluded)]
+
+    def to_json(self):
+        return {filename: list(tags) for filename, tags in self.tags_by_file.items() if tags}
+
+# 🔢 Track registry — stable IDs for every upload, and the numbers !listsongs shows
+class TrackRegistry:
+    """A guild's uploads, each with a stable numeric ID and a position in the listing.
+
+    ``order`` is a compact list of IDs, so number → track is a list index.
+    IDs are never reused. Removals are applied
+    in one compaction pass, so a bulk delete doesn't renumber as it goes.
+    """
+
+    def __init__(self, filenames=(), track_ids=None, next_id=1):
+        self.filenames = {}  # {track_id: filename}
+        self.ids_by_filename = {}  # {filename: track_id}
+        self.order = []  # track ids, by listing position
+        self.next_id = next_id
+        if not track_ids or len(track_ids) != len(filenames):
+            track_ids = [None] * len(filenames)
+        for filename, track_id in zip(filenames, track_ids):
+            self.add(filename, track_id)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        return (self.filenames[track_id] for track_id in self.order)
+
+    def __contains__(self, filename):
+        return filename in self.ids_by_filename
+
+    def add(self, filename, track_id=None):
+        """Registers an upload and returns its ID; uploading the same filename again keeps it."""
+        if filename in self.ids_by_filename:
+            return self.ids_by_filename[filename]
+        if track_id is None or track_id in self.filenames:
+            track_id = self.next_id
+        self.next_id = max(self.next_id, track_id + 1)
+        self.filenames[track_id] = filename
+        self.ids_by_filename[filename] = track_id
+        self.order.append(track_id)
+        return track_id
+
+    def at(self, number):
+        """The track ID listed as ``number`` (1-based), or None."""
+        return self.order[number - 1] if 1 <= number <= len(self.order) else None
+
+    def filename(self, track_id):
+        return self.filenames.get(track_id)
+
+    def id_of(self, filename):
+        return self.ids_by_filename.get(filename)
+
+    def snapshot(self):
+        """The current numbering, for commands that must keep showing the same numbers."""
+        return list(self.order)
+
+    def remove_many(self, track_ids):
+        """Drops the given tracks in a single pass and renumbers once; returns their filenames."""
+        doomed = {track_id for track_id in track_ids if track_id in self.filenames}
+        if not doomed:
+            return []
+        removed = [self.filenames[track_id] for track_id in self.order if track_id in doomed]
+        for track_id in doomed:
+            del self.ids_by_filename[self.filenames.pop(track_id)]
+        self.order = [track_id for track_id in self.order if track_id not in doomed]
+        return removed
+
+    def clear(self):
+        return self.remove_many(list(self.order))
+
+    def entry(self, track_id):
+        """A queue entry for the track."""
+        return LocalTrack(track_id, self.filenames[track_id])
+
+    def to_json(self):
+        return {"uploaded_files": list(self), "track_ids": list(self.order), "next_track_id": self.next_id}
+
+# 🎶 Song queue — typed entries in a deque, counted so a track is found without a scan
+class LocalTrack(namedtuple("LocalTrack", "track_id filename")):
+    """An upload waiting in the queue, held by its stable track ID."""
+
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return self.track_id
+
+    @property
+    def title(self):
+        return self.filename
+
+class RemoteTrack(namedtuple("RemoteTrack", "url title")):
+    """A yt_dlp source waiting in the queue."""
+
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return self.url
+
+class SongQueue:
+    """A guild's queue: a deque for O(1) work at both ends, plus a multiset of its keys.
+
+    ``counts`` says how many times each track (ID) or URL is queued, so a
+    delete that touches nothing queued costs nothing, and any number of
+    tracks are removed together in one pass.
+    """
+
+    def __init__(self):
+        self.entries = deque()
+        self.counts = Counter()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(len(self.entries))
+            return list(islice(self.entries, start, stop))
+        return self.entries[index]
+
+    def append(self, entry):
+        self.entries.append(entry)
+        self.counts[entry.key] += 1
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def appendleft(self, entry):
+        self.entries.appendleft(entry)
+        self.counts[entry.key] += 1
+
+    def popleft(self):
+        entry = self.entries.popleft()
+        self.counts[entry.key] -= 1
+        if not self.counts[entry.key]:
+            del self.counts[entry.key]
+        return entry
+
+    def remove_all(self, keys):
+        """Drops every occurrence of the given keys; returns how many entries went."""
+        doomed = {key for key in keys if key in self.counts}
+        if not doomed:
+            return 0
+        before = len(self.entries)
+        self.entries = deque(entry for entry in self.entries if entry.key not in doomed)
+        for key in doomed:
+            del self.counts[key]
+        return before - len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.counts.clear()
+
+    def shuffle(self):
+        entries = list(self.entries)
+        random.shuffle(entries)
+        self.entries = deque(entries)
+
 # 🌠 EchoMond’s data constellations
-from collections import defaultdict
-usage_counters = defaultdict(int)
-pending_tag_uploads = defaultdict(dict)  # {guild_id: {user_id: [filenames]}}
-file_tags_by_guild = defaultdict(dict)
-uploaded_files_by_guild = defaultdict(list)
-song_queue_by_guild = defaultdict(list)
-last_now_playing_message_by_guild = defaultdict(lambda: None)
-volume_levels_by_guild = defaultdict(lambda: 1.0)
-
-# 📦 Persistent file galaxy
-SAVE_FILE = "uploads_data.json"
-
-def save_upload_data():
-    try:
-        data = {
-            "uploaded_files_by_guild": uploaded_files_by_guild,
-            "file_tags_by_guild": file_tags_by_guild,
+tag_index_by_guild = defaultdict(TagIndex)
+track_registry_by_guild = defaultdict(TrackRegistry)
+track_meta_by_guild = defaultdict(dict)  # {guild_id: {filename: {hash, blob, duration, size, codec, bitrate, uploaded_at, rendition, loudness}}}
+blob_refs_by_guild = defaultdict(Counter)  # {guild_id: {hash: filenames pointing at it}}
+
+# 📦 Persistent file galaxy — each guild stored on its own, written behind the event loop
+LIBRARY_BACKEND = os.getenv("LIBRARY_BACKEND", "json")  # "json" or "sqlite"
+LIBRARY_FOLDER = os.getenv("LIBRARY_FOLDER", "library")
+LIBRARY_DB = os.getenv("LIBRARY_DB", "library.sqlite3")
+SAVE_FILE = "uploads_data.json"  # the old all-guilds file, migrated once
+SAVE_DEBOUNCE_SECONDS = float(os.getenv("SAVE_DEBOUNCE_SECONDS", "2"))
+os.makedirs(LIBRARY_FOLDER, exist_ok=True)
+
+def guild_library_snapshot(guild_id):
+    """Copies a guild's library so it can be written while the loop keeps mutating it."""
+    return {
+        **track_registry_by_guild[guild_id].to_json(),
+        "file_tags": tag_index_by_guild[guild_id].to_json() if guild_id in tag_index_by_guild else {},
+        "track_meta": {name: dict(meta) for name, meta in track_meta_by_guild.get(guild_id, {}).items()},
+    }
+
+def write_atomic(path, payload):
+    """Writes via a temp file and rename, so a crash never leaves half a file."""
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+@contextmanager
+def file_lock(path):
+    """An exclusive advisory lock shared by every EchoMond worker on the host."""
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class JsonLibraryStore:
+    """library/<guild_id>.json, one small file per guild."""
+
+    executor = None  # the loop's default pool is fine for independent files
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, guild_id):
+        return os.path.join(self.folder, f"{guild_id}.json")
+
+    def guild_ids(self):
+        return [int(name[:-5]) for name in os.listdir(self.folder) if name.endswith(".json") and name[:-5].isdigit()]
+
+    def load_guild(self, guild_id):
+        try:
+            with open(self.path(guild_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def all_filenames(self):
+        """Every filename any guild's library names, loaded or not."""
+        return {name for guild_id in self.guild_ids() for name in (self.load_guild(guild_id) or {}).get("uploaded_files", [])}
+
+    def write_guild(self, guild_id, data):
+        write_atomic(self.path(guild_id), json.dumps(data))
+
+class SqliteLibraryStore:
+    """SQLite in WAL mode, so a guild loads with a few indexed queries instead of a whole file.
+
+    All access happens on one dedicated worker thread, off the event loop.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tracks (
+            guild_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            meta TEXT NOT NULL DEFAULT '{}',
+            track_id INTEGER,
+            PRIMARY KEY (guild_id, position)
+        );
+        CREATE INDEX IF NOT EXISTS tracks_by_filename ON tracks (guild_id, filename);
+        CREATE TABLE IF NOT EXISTS guilds (
+            guild_id INTEGER PRIMARY KEY,
+            next_track_id INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (guild_id, name)
+        );
+        CREATE TABLE IF NOT EXISTS track_tags (
+            guild_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            tag_id INTEGER NOT NULL REFERENCES tags (id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, filename, tag_id)
+        );
+        CREATE INDEX IF NOT EXISTS track_tags_by_tag ON track_tags (tag_id, guild_id);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="library")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)  # other workers may hold the write lock
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(tracks)")]
+        if "track_id" not in columns:  # libraries written before stable track IDs
+            self.conn.execute("ALTER TABLE tracks ADD COLUMN track_id INTEGER")
+
+    def guild_ids(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT guild_id FROM tracks")]
+
+    def all_filenames(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT DISTINCT filename FROM tracks")}
+
+    def load_guild(self, guild_id):
+        with self.lock:
+            tracks = self.conn.execute(
+                "SELECT filename, meta, track_id FROM tracks WHERE guild_id = ? ORDER BY position", (guild_id,)
+            ).fetchall()
+            next_id = self.conn.execute("SELECT next_track_id FROM guilds WHERE guild_id = ?", (guild_id,)).fetchone()
+            tags = self.conn.execute(
+                "SELECT tt.filename, t.name FROM track_tags tt JOIN tags t ON t.id = tt.tag_id "
+                "WHERE tt.guild_id = ? ORDER BY tt.filename, tt.position", (guild_id,)
+            ).fetchall()
+        if not tracks and not tags:
+            return None
+        file_tags = {}
+        for filename, name in tags:
+            file_tags.setdefault(filename, []).append(name)
+        return {
+            "uploaded_files": [filename for filename, _, _ in tracks],
+            "track_ids": [track_id for _, _, track_id in tracks] if all(row[2] for row in tracks) else None,
+            "next_track_id": next_id[0] if next_id else 1,
+            "file_tags": file_tags,
+            "track_meta": {filename: json.loads(meta) for filename, meta, _ in tracks if meta != "{}"},
         }
-        with open(SAVE_FILE, "w") as f:
-            json.dump(data, f)
-    except Exception as e:
-        print(f"[Save Error] Could not save upload data: {e}")
 
-def load_upload_data():
+    def write_guild(self, guild_id, data):
+        """Writes only the rows that differ from what is stored, so one tag edit costs a row or two."""
+        meta = data["track_meta"]
+        track_ids = data.get("track_ids") or [None] * len(data["uploaded_files"])
+        tracks = {
+            position: (filename, json.dumps(meta.get(filename, {})), track_id)
+            for position, (filename, track_id) in enumerate(zip(data["uploaded_files"], track_ids))
+        }
+        pairs = {
+            (filename, name): position
+            for filename, tags in data["file_tags"].items() for position, name in enumerate(tags)
+        }
+        with self.lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored = {
+                    position: (filename, stored_meta, track_id)
+                    for position, filename, stored_meta, track_id in conn.execute(
+                        "SELECT position, filename, meta, track_id FROM tracks WHERE guild_id = ?", (guild_id,)
+                    )
+                }
+                conn.executemany(
+                    "DELETE FROM tracks WHERE guild_id = ? AND position = ?",
+                    [(guild_id, position) for position in stored.keys() - tracks.keys()],
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tracks (guild_id, position, filename, meta, track_id) VALUES (?, ?, ?, ?, ?)",
+                    [(guild_id, position, *row) for position, row in tracks.items() if stored.get(position) != row],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO guilds (guild_id, next_track_id) VALUES (?, ?)",
+                    (guild_id, data.get("next_track_id", 1)),
+                )
+
+                tag_ids = dict(conn.execute("SELECT name, id FROM tags WHERE guild_id = ?", (guild_id,)))
+                new_names = {name for _, name in pairs} - tag_ids.keys()
+                if new_names:
+                    conn.executemany("INSERT INTO tags (guild_id, name) VALUES (?, ?)", [(guild_id, name) for name in new_names])
+                    tag_ids = dict(conn.execute("SELECT name, id FROM tags WHERE guild_id = ?", (guild_id,)))
+                names = {tag_id: name for name, tag_id in tag_ids.items()}
+                stored_pairs = {
+                    (filename, names[tag_id]): position
+                    for filename, tag_id, position in conn.execute(
+                        "SELECT filename, tag_id, position FROM track_tags WHERE guild_id = ?", (guild_id,)
+                    )
+                }
+                removed = stored_pairs.keys() - pairs.keys()
+                conn.executemany(
+                    "DELETE FROM track_tags WHERE guild_id = ? AND filename = ? AND tag_id = ?",
+                    [(guild_id, filename, tag_ids[name]) for filename, name in removed],
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO track_tags (guild_id, filename, tag_id, position) VALUES (?, ?, ?, ?)",
+                    [(guild_id, filename, tag_ids[name], position)
+                     for (filename, name), position in pairs.items() if stored_pairs.get((filename, name)) != position],
+                )
+                # A tag no track carries any more goes too; track_tags_by_tag makes each check one index probe
+                conn.executemany(
+                    "DELETE FROM tags WHERE id = ? AND NOT EXISTS (SELECT 1 FROM track_tags WHERE tag_id = ? AND guild_id = ?)",
+                    [(tag_ids[name], tag_ids[name], guild_id) for name in {name for _, name in removed}],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+library_store = SqliteLibraryStore(LIBRARY_DB) if LIBRARY_BACKEND == "sqlite" else JsonLibraryStore(LIBRARY_FOLDER)
+library_loaded = set()  # guilds whose library is in memory
+library_used_at = {}  # {guild_id: monotonic time the library was last needed}
+library_backfills = {}  # {guild_id: backfill task still working through its uploads}
+
+class LibraryWriter:
+    """Collects which guilds changed and flushes only those, on a debounce timer.
+
+    Marking a guild dirty is O(1). A flush snapshots each dirty guild on the
+    loop (so nothing mutates mid-write) and hands it to the store off-loop.
+    """
+
+    def __init__(self, store, debounce):
+        self.store = store
+        self.debounce = debounce
+        self.dirty = set()
+        self.task = None
+
+    def mark(self, guild_id):
+        if guild_id not in library_loaded:
+            return  # never overwrite a library we haven't read
+        self.dirty.add(guild_id)
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self.dirty:
+            await asyncio.sleep(self.debounce)
+            started = time.perf_counter()
+            batch = [(guild_id, guild_library_snapshot(guild_id)) for guild_id in self.dirty]
+            metrics.observe("echomond_library_save_seconds", time.perf_counter() - started, "snapshot")
+            self.dirty.clear()
+            failed = await loop.run_in_executor(self.store.executor, self._write_batch, batch)
+            self.dirty.update(failed)
+
+    def _write_batch(self, batch):
+        failed = []
+        for guild_id, data in batch:
+            started = time.perf_counter()
+            try:
+                self.store.write_guild(guild_id, data)
+            except Exception as e:
+                print(f"[Save Error] Could not save upload data for guild {guild_id}: {e}")
+                metrics.inc("echomond_library_save_failures_total")
+                failed.append(guild_id)
+            metrics.observe("echomond_library_save_seconds", time.perf_counter() - started, "write")
+        return failed
+
+    async def flush(self):
+        """Writes everything pending right away, off the loop; used on shutdown."""
+        batch = [(guild_id, guild_library_snapshot(guild_id)) for guild_id in self.dirty]
+        self.dirty.clear()
+        if batch:
+            loop = asyncio.get_running_loop()
+            self.dirty.update(await loop.run_in_executor(self.store.executor, self._write_batch, batch))
+
+    def flush_now(self):
+        """Blocking flush of everything pending; used at exit and for migration."""
+        batch = [(guild_id, guild_library_snapshot(guild_id)) for guild_id in self.dirty]
+        self.dirty.clear()
+        self.dirty.update(self._write_batch(batch))
+
+library_writer = LibraryWriter(library_store, SAVE_DEBOUNCE_SECONDS)
+atexit.register(library_writer.flush_now)
+
+def save_upload_data(guild_id):
+    library_writer.mark(guild_id)
+
+def load_guild_library(guild_id, data):
+    data = data or {}
+    registry = TrackRegistry(data.get("uploaded_files", []), data.get("track_ids"), data.get("next_track_id", 1))
+    track_registry_by_guild[guild_id] = registry
+    tag_index_by_guild[guild_id] = TagIndex(data.get("file_tags", {}), registry)
+    track_meta_by_guild[guild_id] = data.get("track_meta", {})
+    blob_refs_by_guild[guild_id] = Counter(meta["hash"] for meta in track_meta_by_guild[guild_id].values() if meta.get("blob"))
+    library_loaded.add(guild_id)
+
+async def ensure_guild_loaded(guild_id):
+    """Reads a guild's library from the store the first time the guild needs it."""
+    library_used_at[guild_id] = time.monotonic()
+    if guild_id in library_loaded:
+        return
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(library_store.executor, library_store.load_guild, guild_id)
+    if guild_id not in library_loaded:  # another caller may have won the race
+        load_guild_library(guild_id, data)
+        task = bot.loop.create_task(backfill_guild_metadata(guild_id))
+        library_backfills[guild_id] = task
+        task.add_done_callback(lambda _: library_backfills.pop(guild_id, None))
+
+def unload_guild_library(guild_id):
+    """Drops a guild's library from memory unless it still has changes to write or a backfill running; it reloads on next use."""
+    if guild_id not in library_loaded or guild_id in library_writer.dirty or guild_id in library_backfills:
+        return False
+    library_loaded.discard(guild_id)
+    library_used_at.pop(guild_id, None)
+    for state in (track_registry_by_guild, tag_index_by_guild, track_meta_by_guild, blob_refs_by_guild, upload_stats_by_guild):
+        state.pop(guild_id, None)
+    return True
+
+def migrate_legacy_upload_data():
+    """Moves the old all-guilds uploads_data.json (and, for SQLite, per-guild JSON files) into the store, once."""
+    sources = []
     try:
         with open(SAVE_FILE, "r") as f:
             data = json.load(f)
-            for guild_id, files in data.get("uploaded_files_by_guild", {}).items():
-                uploaded_files_by_guild[int(guild_id)] = files
-            for guild_id, tags in data.get("file_tags_by_guild", {}).items():
-                file_tags_by_guild[int(guild_id)] = tags
-        print("[Startup] 🌙 EchoMond loaded past uploads from the stardust.")
+        for guild_id, files in data.get("uploaded_files_by_guild", {}).items():
+            sources.append((int(guild_id), {
+                "uploaded_files": files,
+                "file_tags": data.get("file_tags_by_guild", {}).get(guild_id, {}),
+                "track_meta": data.get("track_meta_by_guild", {}).get(guild_id, {}),
+            }))
     except FileNotFoundError:
-        print("[Startup] ✨ No upload memory found. Beginning anew.")
+        data = None
+    if isinstance(library_store, SqliteLibraryStore) and not library_store.guild_ids():
+        json_store = JsonLibraryStore(LIBRARY_FOLDER)
+        sources += [(guild_id, json_store.load_guild(guild_id)) for guild_id in json_store.guild_ids()]
+    if not sources:
+        return
+
+    failed = library_writer._write_batch(sources)
+    if data is not None and not failed:
+        os.replace(SAVE_FILE, f"{SAVE_FILE}.migrated")
+    print(f"[Startup] 📦 Migrated {len(sources) - len(failed)} guild(s) into the {LIBRARY_BACKEND} library.")
+
+def load_upload_data():
+    """Migrates old save files once; each guild's library is read lazily, on its first call."""
+    try:
+        with file_lock(os.path.join(LIBRARY_FOLDER, ".migrate.lock")):  # one worker migrates, the rest find it done
+            migrate_legacy_upload_data()
+        guild_count = len(library_store.guild_ids())
+        if guild_count:
+            print(f"[Startup] 🌙 {guild_count} realm(s) of uploads wait in the {LIBRARY_BACKEND} library; each wakes on first call.")
+        else:
+            print("[Startup] ✨ No upload memory found. Beginning anew.")
     except Exception as e:
         print(f"[Load Error] 🚨 Could not load upload data: {e}")
 
-load_upload_data()
+# 🎚️ Upload ingest — each upload is normalized once into a compact Opus rendition
+RENDITION_BITRATE = os.getenv("RENDITION_BITRATE", "128k")
+KEEP_ORIGINAL_UPLOADS = os.getenv("KEEP_ORIGINAL_UPLOADS", "1") != "0"
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+
+ingest_slots = asyncio.Semaphore(INGEST_CONCURRENCY)
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+LOUDNESS_PATTERN = re.compile(r"I:\s+(-?\d+(?:\.\d+)?) LUFS")
+
+# 🧬 Blob store — every unique sound kept once, shared by the guilds that uploaded it
+BLOB_FOLDER = os.path.join(MUSIC_FOLDER, "blobs")
+
+class BlobStore:
+    """Content-addressed uploads: blobs/<ab>/<hash>.<ext>, next to <hash>.opus and <hash>.json.
+
+    Each guild holding a blob leaves a marker in <hash>.refs/<guild_id>, so the
+    reference count lives on disk, survives restarts and is shared by every
+    process on the host. The blob, its rendition and its sidecar go only when
+    the last marker does. The sidecar keeps what is true of the audio itself
+    (duration, codec, loudness...), so it is measured once, not once per guild.
+    Everything that touches markers runs on one thread, in order, and under
+    a file lock shared with any other EchoMond worker on the host.
+    """
+
+    def __init__(self, folder, keep_originals=True):
+        self.folder = folder
+        self.keep_originals = keep_originals
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blobs")
+        self.lock_path = os.path.join(folder, ".lock")  # markers change under it, in every worker
+        os.makedirs(os.path.join(folder, "tmp"), exist_ok=True)
+
+    def path(self, digest, ext):
+        return os.path.join(self.folder, digest[:2], f"{digest}.{ext}")
+
+    def rendition_path(self, digest):
+        return self.path(digest, "opus")
+
+    def refs_path(self, digest):
+        return self.path(digest, "refs")
+
+    def temp_path(self):
+        return os.path.join(self.folder, "tmp", f"{uuid.uuid4().hex}.part")
+
+    def referenced(self, digest):
+        try:
+            return bool(os.listdir(self.refs_path(digest)))
+        except FileNotFoundError:
+            return False
+
+    def put(self, source, digest, ext, guild_id, link=False):
+        """Blocking: files ``source`` under its hash (or drops it as a duplicate) and refs it for the guild.
+
+        ``link`` hard-links instead of moving, for legacy files other guilds may still point at.
+        """
+        with file_lock(self.lock_path):
+            target = self.path(digest, ext)
+            os.makedirs(self.refs_path(digest), exist_ok=True)
+            with open(os.path.join(self.refs_path(digest), str(guild_id)), "a"):
+                pass
+            stored = os.path.exists(target) or (not self.keep_originals and os.path.exists(self.rendition_path(digest)))
+            if stored:
+                if not link:
+                    os.remove(source)
+            elif link:
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+            else:
+                os.replace(source, target)
+            return target
+
+    def unref(self, digest, guild_id):
+        """Blocking: drops the guild's marker; deletes the blob once nobody holds it. Returns the bytes freed."""
+        with file_lock(self.lock_path):
+            try:
+                os.remove(os.path.join(self.refs_path(digest), str(guild_id)))
+            except FileNotFoundError:
+                pass
+            if self.referenced(digest):
+                return 0
+            return self._delete(digest)
+
+    def _delete(self, digest, keep=lambda name: False):
+        freed = 0
+        shard = os.path.dirname(self.refs_path(digest))
+        for name in os.listdir(shard):
+            if name.startswith(f"{digest}.") and name != f"{digest}.refs" and not keep(name):
+                path = os.path.join(shard, name)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    freed += size
+                except OSError as e:
+                    print(f"[Warning] Could not delete blob {name}: {e}")
+        if not keep(f"{digest}.refs"):
+            try:
+                os.rmdir(self.refs_path(digest))
+            except OSError:
+                pass
+        return freed
+
+    def drop_original(self, digest):
+        """Blocking: deletes a blob's original once its rendition exists; returns the bytes freed."""
+        with file_lock(self.lock_path):
+            if not os.path.exists(self.rendition_path(digest)):
+                return 0
+            return self._delete(digest, keep=lambda name: not name.endswith((".mp3", ".wav", ".bin")))
+
+    def sweep(self, cutoff, claims):
+        """Blocking: reconciles the store with what loaded guilds claim.
+
+        Removes blobs nobody holds, leftover transcode temps and markers of
+        loaded guilds that no longer reference the blob; anything newer than
+        ``cutoff`` may still be mid-ingest and is left alone. Returns
+        ({hash: bytes}, {hash: holders}, bytes freed).
+        """
+        with file_lock(self.lock_path):
+            usage, holders, freed = {}, {}, 0
+            for shard in os.listdir(self.folder):
+                shard_path = os.path.join(self.folder, shard)
+                if shard == "tmp" or not os.path.isdir(shard_path):
+                    continue
+                files_by_digest = defaultdict(list)
+                for name in os.listdir(shard_path):
+                    names = files_by_digest[name.split(".")[0]]  # a lone .refs still lists its digest
+                    if not name.endswith(".refs"):
+                        names.append(name)
+
+                for digest, names in files_by_digest.items():
+                    refs = self.refs_path(digest)
+                    markers = os.listdir(refs) if os.path.isdir(refs) else []
+                    for marker in list(markers):
+                        guild_id = int(marker) if marker.isdigit() else None
+                        path = os.path.join(refs, marker)
+                        if guild_id in claims and digest not in claims[guild_id] and os.path.getmtime(path) < cutoff:
+                            os.remove(path)
+                            markers.remove(marker)
+
+                    paths = [os.path.join(shard_path, name) for name in names]
+                    if not markers:
+                        if all(os.path.getmtime(path) < cutoff for path in paths):
+                            freed += self._delete(digest)
+                        continue
+                    for path in paths:
+                        if path.endswith(".part") and os.path.getmtime(path) < cutoff:
+                            freed += os.path.getsize(path)
+                            os.remove(path)
+                    usage[digest] = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+                    holders[digest] = len(markers)
+            return usage, holders, freed
+
+    def info(self, digest):
+        try:
+            with open(self.path(digest, "json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def update_info(self, digest, facts):
+        """Blocking: merges facts into the blob's sidecar."""
+        with file_lock(self.lock_path):
+            if not os.path.isdir(self.refs_path(digest)):
+                return  # released meanwhile
+            info = self.info(digest)
+            info.update(facts)
+            write_atomic(self.path(digest, "json"), json.dumps(info))
+
+    def adopt_rendition(self, digest, legacy_path):
+        """Blocking: links a pre-blob rendition into place so it needn't be transcoded again."""
+        with file_lock(self.lock_path):
+            target = self.rendition_path(digest)
+            if not os.path.exists(target) and os.path.exists(legacy_path):
+                os.link(legacy_path, target)
+            return target if os.path.exists(target) else None
+
+blobs = BlobStore(BLOB_FOLDER, KEEP_ORIGINAL_UPLOADS)
+blob_transcodes = {}  # {hash: task}, so guilds uploading the same sound share one transcode
+
+def hash_file(path):
+    """Blocking: sha256 of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def store_upload(guild_id, filename, source, link=False, digest=None):
+    """Files an upload in the blob store and points the guild's manifest entry at it."""
+    loop = asyncio.get_running_loop()
+    digest = digest or await loop.run_in_executor(None, hash_file, source)
+    ext = os.path.splitext(filename)[1].lstrip(".").lower() or "bin"
+    blob = await loop.run_in_executor(blobs.executor, blobs.put, source, digest, ext, guild_id, link)
+
+    track_registry_by_guild[guild_id].add(filename)
+    entry = track_meta_by_guild[guild_id].setdefault(filename, {})
+    previous = entry.get("hash") if entry.get("blob") else None
+    if previous != digest:
+        if entry.get("hash") not in (None, digest):
+            entry.clear()  # new audio under an old name; its facts no longer apply
+        blob_refs_by_guild[guild_id][digest] += 1
+        if previous:
+            release_blob(guild_id, previous)
+    entry.update(hash=digest, blob=blob)
+    return entry
+
+def release_blob(guild_id, digest):
+    """Drops one of the guild's references; the last one lets go of its marker."""
+    refs = blob_refs_by_guild[guild_id]
+    refs[digest] -= 1
+    if refs[digest] > 0:
+        return
+    del refs[digest]
+    future = bot.loop.run_in_executor(blobs.executor, blobs.unref, digest, guild_id)
+    future.add_done_callback(
+        lambda done: done.exception() and print(f"[Warning] Could not release blob {digest[:12]}: {done.exception()}")
+    )
+
+# 📥 Attachment intake — streamed to disk with a running hash, capped and checked before filing
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+UPLOAD_WRITE_BYTES = 1024 * 1024  # chunks are gathered up to this much per write, which runs off the loop
+
+upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+upload_session = None  # opened on the first upload
+upload_stats_by_guild = defaultdict(lambda: {"files": 0, "bytes": 0, "seconds": 0.0, "rejected": Counter()})
+
+class UploadRejected(Exception):
+    """An attachment EchoMond won't keep; the message says why."""
+
+def looks_like_audio(header, filename):
+    """Whether the first bytes match the container the extension promises."""
+    if filename.lower().endswith(".wav"):
+        return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+    return header[:3] == b"ID3" or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0)
+
+async def fetch_attachment(attachment):
+    """Streams an attachment into a temp file, hashing as it goes; returns (path, hash, size).
+
+    Stops as soon as the file outgrows UPLOAD_MAX_BYTES or its header isn't audio.
+    """
+    global upload_session
+    if attachment.size > UPLOAD_MAX_BYTES:
+        raise UploadRejected(f"larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MiB")
+    if upload_session is None or upload_session.closed:
+        upload_session = aiohttp.ClientSession()
+
+    loop = asyncio.get_running_loop()
+    temp_path = blobs.temp_path()
+    digest = hashlib.sha256()
+    header = b""
+    size = 0
+    pending, pending_bytes = [], 0
+    try:
+        f = await loop.run_in_executor(blobs.executor, open, temp_path, "wb")
+        try:
+            async with upload_session.get(attachment.url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(UPLOAD_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > UPLOAD_MAX_BYTES:
+                        raise UploadRejected(f"larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MiB")
+                    if len(header) < 12:
+                        header += chunk[:12 - len(header)]
+                        if len(header) == 12 and not looks_like_audio(header, attachment.filename):
+                            raise UploadRejected("doesn't sound like audio")
+                    digest.update(chunk)
+                    pending.append(chunk)
+                    pending_bytes += len(chunk)
+                    if pending_bytes >= UPLOAD_WRITE_BYTES:
+                        await loop.run_in_executor(blobs.executor, f.write, b"".join(pending))
+                        pending, pending_bytes = [], 0
+            if pending:
+                await loop.run_in_executor(blobs.executor, f.write, b"".join(pending))
+        finally:
+            f.close()
+        if not looks_like_audio(header, attachment.filename):
+            raise UploadRejected("doesn't sound like audio")
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size
+
+async def receive_upload(guild_id, attachment):
+    """Fetches, checks and files one attachment; returns (filename, None) or (None, reason)."""
+    stats = upload_stats_by_guild[guild_id]
+    started = time.perf_counter()
+    try:
+        async with upload_slots:
+            temp_path, digest, size = await fetch_attachment(attachment)
+        await store_upload(guild_id, attachment.filename, temp_path, digest=digest)
+    except UploadRejected as e:
+        stats["rejected"][str(e)] += 1
+        return None, str(e)
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        print(f"[Upload] Could not fetch {attachment.filename}: {e}")
+        stats["rejected"]["couldn't be fetched"] += 1
+        return None, "couldn't be fetched"
+    stats["files"] += 1
+    stats["bytes"] += size
+    stats["seconds"] += time.perf_counter() - started
+    return attachment.filename, None
+
+def report_upload_batch(guild_id, received, rejected, batch_bytes, elapsed):
+    """Logs one message's uploads alongside the guild's running totals."""
+    stats = upload_stats_by_guild[guild_id]
+    mib = batch_bytes / (1024 * 1024)
+    rate = mib / elapsed if elapsed > 0 else 0.0
+    average = stats["bytes"] / (1024 * 1024) / stats["seconds"] if stats["seconds"] else 0.0
+    turned_away = sum(stats["rejected"].values())
+    print(
+        f"[Upload] 📥 Guild {guild_id}: {received} file(s), {mib:.1f} MiB in {elapsed:.2f}s ({rate:.1f} MiB/s), "
+        f"{rejected} rejected · totals {stats['files']} file(s), {average:.1f} MiB/s per file, {turned_away} rejected"
+    )
+
+def local_track_source(guild_id, filename):
+    """Returns (path, duration) to play for an upload, preferring its rendition.
+
+    The duration is None when the upload hasn't been indexed yet.
+    """
+    meta = track_meta_by_guild.get(guild_id, {}).get(filename) or {}
+    duration = meta.get("duration")
+    if meta.get("rendition") and os.path.exists(meta["rendition"]):
+        return meta["rendition"], int(duration or 0)
+    return meta.get("blob") or os.path.join(MUSIC_FOLDER, filename), duration
+
+def read_track_metadata(path):
+    """Blocking: reads size and audio header details for one upload."""
+    meta = {"duration": 0, "codec": None, "bitrate": None}
+    meta["size"] = os.path.getsize(path)
+    try:
+        audio = MP3(path) if path.lower().endswith(".mp3") else WAVE(path)
+        if audio and audio.info:
+            meta["duration"] = int(audio.info.length)
+            meta["codec"] = "mp3" if isinstance(audio, MP3) else "pcm"
+            meta["bitrate"] = getattr(audio.info, "bitrate", None)
+    except Exception as e:
+        print(f"[Metadata] Could not parse {os.path.basename(path)}: {e}")
+    return meta
+
+async def index_upload(guild_id, filename, uploaded_at=None):
+    """Reads an upload's metadata off the event loop and stores it in the guild's index.
+
+    A blob's header is parsed once; later guilds get it from the blob's sidecar.
+    """
+    known = track_meta_by_guild.get(guild_id, {}).get(filename) or {}
+    digest = known.get("hash")
+    path = known.get("blob") or os.path.join(MUSIC_FOLDER, filename)
+    loop = asyncio.get_running_loop()
+    try:
+        facts = await loop.run_in_executor(blobs.executor, blobs.info, digest) if digest else {}
+        if "size" in facts:
+            meta = {key: facts[key] for key in ("duration", "codec", "bitrate", "size")}
+        else:
+            meta = await loop.run_in_executor(None, read_track_metadata, path)
+            if digest:
+                await loop.run_in_executor(blobs.executor, blobs.update_info, digest, meta)
+        meta["hash"] = digest or await loop.run_in_executor(None, hash_file, path)
+        if uploaded_at is None:
+            uploaded_at = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+    except OSError as e:
+        print(f"[Metadata] Could not index {filename}: {e}")
+        return {}
+    if filename not in track_registry_by_guild[guild_id]:
+        return meta
+    entry = track_meta_by_guild[guild_id].setdefault(filename, {})
+    if entry.get("hash", meta["hash"]) != meta["hash"]:
+        return entry  # replaced by a newer upload meanwhile
+    if entry.get("duration"):
+        meta.pop("duration")  # the rendition pass measured it already
+    entry.update(meta, uploaded_at=entry.get("uploaded_at") or uploaded_at.isoformat())
+    save_upload_data(guild_id)
+    return entry
+
+async def adopt_legacy_upload(guild_id, filename):
+    """Moves a pre-blob upload (a flat file in downloads/) into the blob store.
+
+    The flat file is hard-linked, not moved: under the old layout another
+    guild may hold a file of the same name. Its old rendition comes along.
+    """
+    path = os.path.join(MUSIC_FOLDER, filename)
+    if not os.path.exists(path):
+        return None
+    entry = await store_upload(guild_id, filename, path, link=True)
+    legacy_rendition = entry.get("rendition")
+    if legacy_rendition and not legacy_rendition.startswith(BLOB_FOLDER):
+        loop = asyncio.get_running_loop()
+        rendition = await loop.run_in_executor(blobs.executor, blobs.adopt_rendition, entry["hash"], legacy_rendition)
+        entry["rendition"] = rendition
+        if rendition:
+            facts = {key: entry[key] for key in ("duration", "loudness") if key in entry}
+            await loop.run_in_executor(blobs.executor, blobs.update_info, entry["hash"], dict(facts, rendition=rendition))
+    save_upload_data(guild_id)
+    return entry
+
+async def backfill_guild_metadata(guild_id):
+    """Moves a guild's older uploads into the blob store, then indexes and transcodes them, one at a time."""
+    indexed = adopted = 0
+    for filename in list(track_registry_by_guild[guild_id]):
+        meta = track_meta_by_guild.get(guild_id, {}).get(filename) or {}
+        if not meta.get("blob"):
+            meta = await adopt_legacy_upload(guild_id, filename)
+            if meta is None:
+                continue
+            adopted += 1
+        if "size" not in meta:
+            await index_upload(guild_id, filename)
+            indexed += 1
+        if not meta.get("rendition"):
+            await ingest_upload(guild_id, filename)
+    if adopted:
+        print(f"[Blobs] 🧬 Moved {adopted} upload(s) of guild {guild_id} into the blob store.")
+    if indexed:
+        print(f"[Metadata] 🗂️ Backfilled metadata for {indexed} upload(s) in guild {guild_id}.")
+
+def remove_upload_files(guild_id, filename):
+    """Forgets an upload's metadata and lets go of its blob; the bytes go with the last guild holding them."""
+    removed = False
+    meta = track_meta_by_guild.get(guild_id, {}).pop(filename, None) or {}
+    if meta.get("blob"):
+        release_blob(guild_id, meta["hash"])
+        return True
+    for path in (os.path.join(MUSIC_FOLDER, filename), meta.get("rendition")):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+                removed = True
+            except Exception as e:
+                print(f"[Warning] Could not delete {path}: {e}")
+    return removed
+
+def forget_uploads(guild_id, track_ids):
+    """Removes uploads from a guild's library, queue and tags in one pass; returns their filenames."""
+    track_ids = set(track_ids)
+    deleted = track_registry_by_guild[guild_id].remove_many(track_ids)
+    player = players.peek(guild_id)
+    if player:
+        player.queue.remove_all(track_ids)
+    for filename in deleted:
+        # Let go of its blob; the audio itself goes once no guild holds it
+        remove_upload_files(guild_id, filename)
+        tag_index_by_guild[guild_id].clear(filename)
+    save_upload_data(guild_id)
+    return deleted
+
+async def ingest_upload(guild_id, filename):
+    """Gives an upload its Opus rendition and loudness; a blob is only transcoded the first time."""
+    meta = track_meta_by_guild.get(guild_id, {}).get(filename) or {}
+    digest = meta.get("hash")
+    if not meta.get("blob"):
+        return
+    task = blob_transcodes.get(digest)
+    if task is None:
+        task = bot.loop.create_task(transcode_blob(digest, meta["blob"]))
+        blob_transcodes[digest] = task
+        task.add_done_callback(lambda _: blob_transcodes.pop(digest, None))
+    facts = await asyncio.shield(task)
+
+    entry = track_meta_by_guild.get(guild_id, {}).get(filename)
+    if not facts or entry is None or entry.get("hash") != digest:
+        return  # deleted or replaced while we were transcoding
+    entry.update(facts)
+    save_upload_data(guild_id)
+
+async def transcode_blob(digest, source):
+    """Transcodes a blob to Opus/Ogg and measures its duration and loudness in one ffmpeg pass."""
+    loop = asyncio.get_running_loop()
+    target = blobs.rendition_path(digest)
+    known = await loop.run_in_executor(blobs.executor, blobs.info, digest)
+    if known.get("rendition") and os.path.exists(target):
+        return {key: known[key] for key in ("rendition", "loudness", "duration") if key in known}
+
+    temp = f"{target}.{os.getpid()}.part"
+    async with ingest_slots:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-hide_banner", "-y", "-i", source,
+            "-map", "0:a:0", "-vn", "-c:a", "libopus", "-b:a", RENDITION_BITRATE, "-f", "ogg", temp,
+            "-map", "0:a:0", "-af", "ebur128", "-f", "null", "-",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+
+    log = stderr.decode(errors="ignore")
+    if process.returncode != 0:
+        if os.path.exists(temp):
+            os.remove(temp)
+        last_line = log.strip().splitlines()[-1] if log.strip() else f"exit code {process.returncode}"
+        print(f"[Ingest Error] Could not transcode {os.path.basename(source)}: {last_line}")
+        return None
+
+    if not blobs.referenced(digest):
+        os.remove(temp)  # every guild let go of it while we were transcoding
+        return None
+    os.replace(temp, target)
+
+    duration = DURATION_PATTERN.search(log)
+    loudness = LOUDNESS_PATTERN.findall(log)
+    facts = {"rendition": target, "loudness": float(loudness[-1]) if loudness else None}
+    if duration:
+        facts["duration"] = int(int(duration[1]) * 3600 + int(duration[2]) * 60 + float(duration[3]))
+    await loop.run_in_executor(blobs.executor, blobs.update_info, digest, facts)
+    if not KEEP_ORIGINAL_UPLOADS and os.path.exists(source):
+        os.remove(source)
+    print(f"[Ingest] 🎚️ {digest[:12]} → {os.path.basename(target)} ({os.path.getsize(target) // 1024} KiB)")
+    return facts
+
+# 🧹 Janitor — sweeps downloads/ back in line with the library, the cache and the disk quotas
+JANITOR_INTERVAL_SECONDS = int(os.getenv("JANITOR_INTERVAL_SECONDS", "900"))
+JANITOR_GRACE_SECONDS = int(os.getenv("JANITOR_GRACE_SECONDS", "3600"))  # younger files may be mid-download
+GUILD_QUOTA_BYTES = int(os.getenv("GUILD_QUOTA_BYTES", "0"))  # 0 means unlimited
+DOWNLOADS_QUOTA_BYTES = int(os.getenv("DOWNLOADS_QUOTA_BYTES", "0"))
+JANITOR_EVICTION = os.getenv("JANITOR_EVICTION", "originals")  # "originals" never deletes a song; "oldest" may
+LEGACY_RENDITION_FOLDER = os.path.join(MUSIC_FOLDER, "renditions")
+
+class Janitor:
+    """Periodically reconciles downloads/ with what the bot still needs.
+
+    Each sweep removes stale partial downloads, one-off YouTube files that
+    never got cleaned up, loose files no library names and blobs nobody
+    holds. It then enforces the per-guild and global quotas. The mildest
+    step comes first: trimming the audio cache, then dropping originals that
+    already have an Opus rendition. Only under the "oldest" policy does it
+    delete a guild's oldest uploads. ``reclaimed_bytes`` counts everything
+    it has freed since startup.
+    """
+
+    def __init__(self, interval, grace):
+        self.interval = interval
+        self.grace = grace
+        self.reclaimed_bytes = 0
+        self.runs = 0
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"[Janitor] Sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        loop = asyncio.get_running_loop()
+        cutoff = time.time() - self.grace
+        names = await loop.run_in_executor(library_store.executor, library_store.all_filenames)
+        for guild_id in library_loaded:
+            names.update(track_registry_by_guild[guild_id])
+        playing = {player.current["url"] for player in players.values() if player.current}
+        claims = {guild_id: set(blob_refs_by_guild[guild_id]) for guild_id in library_loaded}
+        cached = audio_cache.tracked_paths()
+
+        loose_bytes, freed = await loop.run_in_executor(None, self._sweep_loose_files, names, playing, cached, cutoff)
+        usage, holders, blob_freed = await loop.run_in_executor(blobs.executor, blobs.sweep, cutoff, claims)
+        freed += blob_freed
+
+        if GUILD_QUOTA_BYTES:
+            for guild_id, hashes in claims.items():
+                over = sum(usage.get(digest, 0) for digest in hashes) - GUILD_QUOTA_BYTES
+                if over > 0:
+                    freed += await self._reclaim(over, [guild_id], usage, holders)
+
+        if DOWNLOADS_QUOTA_BYTES:
+            over = loose_bytes + audio_cache.total_bytes + sum(usage.values()) - DOWNLOADS_QUOTA_BYTES
+            if over > 0:
+                trimmed = audio_cache.trim(over)
+                freed += trimmed
+                if over > trimmed:
+                    freed += await self._reclaim(over - trimmed, list(claims), usage, holders)
+
+        self.runs += 1
+        self.reclaimed_bytes += freed
+        total = loose_bytes + audio_cache.total_bytes + sum(usage.values())
+        if freed:
+            print(
+                f"[Janitor] 🧹 Reclaimed {freed / (1024 * 1024):.1f} MiB "
+                f"({self.reclaimed_bytes / (1024 * 1024):.1f} MiB since waking); downloads/ holds {total / (1024 * 1024):.1f} MiB."
+            )
+        return freed
+
+    def _sweep_loose_files(self, names, playing, cached, cutoff):
+        """Blocking: clears stale partials and files outside the managed stores that nothing names.
+
+        In the audio cache folder, anything the cache's index doesn't track
+        (``cached``) is loose too: orphaned sidecars, abandoned downloads.
+        Worker 0 also removes the cache folders of retired worker ids. Returns (bytes still held, bytes freed); tracked cache files are left
+        out, since the cache counts its own.
+        """
+        held = freed = 0
+        folders = [
+            (MUSIC_FOLDER, lambda name: name in names),
+            (LEGACY_RENDITION_FOLDER, lambda name: name.endswith(".opus") and name[:-5] in names),
+            (os.path.join(blobs.folder, "tmp"), lambda name: False),
+            (AUDIO_CACHE_FOLDER, lambda name: False),  # only what the cache tracks is kept
+            (AUDIO_CACHE_ROOT, lambda name: False),  # files from before caches were kept per worker
+        ]
+        for folder, wanted in folders:
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                if os.path.abspath(path) in cached:
+                    continue
+                if wanted(name) or path in playing or stat.st_mtime >= cutoff:
+                    held += stat.st_size
+                    continue
+                try:
+                    os.remove(path)
+                    freed += stat.st_size
+                except OSError as e:
+                    print(f"[Janitor] Could not delete {path}: {e}")
+
+        if WORKER_ID == "0":  # one worker clears the caches of workers that no longer exist
+            for folder in retired_cache_folders():
+                if os.path.getmtime(folder) < cutoff:
+                    size = sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+                    shutil.rmtree(folder, ignore_errors=True)
+                    freed += size
+        return held, freed
+
+    async def _reclaim(self, needed, guild_ids, usage, holders):
+        """Frees about ``needed`` bytes from these guilds' uploads, mildest step first."""
+        loop = asyncio.get_running_loop()
+        freed = 0
+        hashes = sorted({digest for guild_id in guild_ids for digest in blob_refs_by_guild[guild_id]},
+                        key=lambda digest: usage.get(digest, 0), reverse=True)
+        for digest in hashes:
+            if freed >= needed:
+                return freed
+            dropped = await loop.run_in_executor(blobs.executor, blobs.drop_original, digest)
+            usage[digest] = usage.get(digest, 0) - dropped
+            freed += dropped
+
+        if freed >= needed or JANITOR_EVICTION != "oldest":
+            return freed
+        playing = {(guild_id, player.current["song"]) for guild_id, player in players.items() if player.current}
+        oldest = sorted(
+            (meta.get("uploaded_at") or "", guild_id, filename)
+            for guild_id in guild_ids
+            for filename, meta in track_meta_by_guild[guild_id].items() if meta.get("blob")
+        )
+        for _, guild_id, filename in oldest:
+            if freed >= needed:
+                break
+            registry = track_registry_by_guild[guild_id]
+            track_id = registry.id_of(filename)
+            if track_id is None or (guild_id, registry.entry(track_id)) in playing:
+                continue
+            digest = track_meta_by_guild[guild_id][filename]["hash"]
+            if blob_refs_by_guild[guild_id][digest] == 1:
+                holders[digest] = holders.get(digest, 1) - 1
+                if holders[digest] <= 0:
+                    freed += usage.pop(digest, 0)  # this guild held the last reference
+            forget_uploads(guild_id, [track_id])
+            print(f"[Janitor] 🍂 Evicted {filename} from guild {guild_id} to stay within quota.")
+        return freed
+
+janitor = Janitor(JANITOR_INTERVAL_SECONDS, JANITOR_GRACE_SECONDS)
+
+@bot.event
+async def setup_hook():
+    """Runs once before the gateway connects: the only blocking startup work, kept off the loop."""
+    loop = asyncio.get_running_loop()
+    # docker stop, systemd and launcher.py all send SIGTERM, which skips atexit; close (and save) on it instead
+    loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(bot.close()))
+    await asyncio.gather(
+        loop.run_in_executor(library_store.executor, load_upload_data),
+        loop.run_in_executor(None, audio_cache.reconcile),
+        metrics.start(),
+    )
+    print(f"[Startup] ⏱️ Library and cache ready in {time.perf_counter() - STARTED_AT:.2f}s.")
 
 @bot.event
 async def on_ready():
-    for guild in bot.guilds:
-        vc = guild.voice_client
-        if vc and vc.is_connected():
-            await vc.disconnect(force=True)
-            print(f"🧹 Disconnected stale voice connection in: {guild.name} ({guild.id})")
+    await voice_reaper.reap([vc for vc in bot.voice_clients if vc.is_connected()], "stale at startup")
 
     print(f"🌙 EchoMond wakes... and the old echoes are gone.")
     print(f"[EchoMond Online] Logged in as: {bot.user} (ID: {bot.user.id})")
+    print(f"[Shards] 🪐 Worker {WORKER_ID} holds shard(s) {sorted(bot.shards)} of {bot.shard_count}.")
     print("Connected to these realms:")
 
     for guild in bot.guilds:
@@ -118,6 +2209,30 @@ async def on_ready():
 
     print("🌌 EchoMond floats through the stars, listening for your signal.")
 
+    if getattr(bot, "time_to_ready", None) is None:
+        bot.time_to_ready = time.perf_counter() - STARTED_AT
+        print(f"[Startup] ⏱️ Time to ready: {bot.time_to_ready:.2f}s across {len(bot.guilds)} realm(s).")
+    janitor.start()
+    players.start()
+    voice_supervisor.start()
+    voice_reaper.start()
+
+@bot.before_invoke
+async def load_guild_before_command(ctx):
+    ctx.invoked_at = time.perf_counter()
+    if ctx.guild:
+        await ensure_guild_loaded(ctx.guild.id)
+
+@bot.after_invoke
+async def record_command_metrics(ctx):
+    """Runs after every command, failed or not, so each one lands in the latency histogram."""
+    elapsed = time.perf_counter() - getattr(ctx, "invoked_at", time.perf_counter())
+    name = ctx.command.qualified_name
+    metrics.observe("echomond_command_seconds", elapsed, name)
+    metrics.inc("echomond_commands_total", name, "error" if ctx.command_failed else "ok")
+    if ctx.guild:
+        metrics.inc("echomond_guild_busy_seconds_total", str(ctx.guild.id), amount=elapsed)
+
 @bot.event
 async def on_message(message):
     # Let cosmic whispers reach the stars 🌌
@@ -140,26 +2255,40 @@ async def on_message(message):
 
     # Handle song uploads 🌒
     if message.attachments:
-        new_files = []
-        for attachment in message.attachments:
-            if attachment.filename.endswith(('.mp3', '.wav')):
-                file_path = os.path.join(MUSIC_FOLDER, attachment.filename)
-                await attachment.save(file_path)
-                uploaded_files_by_guild[guild_id].append(attachment.filename)
-                new_files.append(attachment.filename)
+        audio = [attachment for attachment in message.attachments if attachment.filename.endswith(('.mp3', '.wav'))]
+        if not audio:
+            return
+        await ensure_guild_loaded(guild_id)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(receive_upload(guild_id, attachment) for attachment in audio))
+        new_files = [filename for filename, _ in results if filename]
+        rejected = [(attachment.filename, reason) for attachment, (_, reason) in zip(audio, results) if reason]
+        batch_bytes = sum(attachment.size for attachment, (filename, _) in zip(audio, results) if filename)
+        report_upload_batch(guild_id, len(new_files), len(rejected), batch_bytes, time.perf_counter() - started)
+
+        if rejected:
+            await message.channel.send(
+                "🚫 These sounds couldn't enter the archive:\n"
+                + "\n".join(f"— `{filename}`: {reason}" for filename, reason in rejected)
+            )
+
+        for filename in new_files:
+            bot.loop.create_task(index_upload(guild_id, filename, message.created_at))
+            bot.loop.create_task(ingest_upload(guild_id, filename))
 
         if new_files:
-            pending_tag_uploads[guild_id][user_id] = new_files
+            get_player(message.guild).pending_tags[user_id] = new_files
             await message.channel.send(
                 f"{FLAVOR['upload_message']}\n"
                 f"🎵 Uploaded: **{', '.join(new_files)}**\n"
                 f"💫 {FLAVOR['tag_prompt']}"
             )
-            save_upload_data()
+            save_upload_data(guild_id)
         return
 
     # Handle tag replies 🌙
-    if message.reference and user_id in pending_tag_uploads[guild_id]:
+    player = players.peek(guild_id)
+    if message.reference and player and user_id in player.pending_tags:
         try:
             replied_message = await message.channel.fetch_message(message.reference.message_id)
         except (discord.NotFound, discord.Forbidden, discord.HTTPException):
@@ -173,16 +2302,17 @@ async def on_message(message):
             await message.channel.send(FLAVOR['tag_none_found'])
             return
 
-        for filename in pending_tag_uploads[guild_id][user_id]:
-            file_tags_by_guild[guild_id].setdefault(filename, []).extend(tags)
+        await ensure_guild_loaded(guild_id)
+        for filename in player.pending_tags[user_id]:
+            tag_index_by_guild[guild_id].add(filename, tags)
 
         await message.channel.send(
             f"{FLAVOR['tag_success_reply']}\n"
-            f"🌌 Tagged **{len(pending_tag_uploads[guild_id][user_id])}** file(s) with: `{', '.join(tags)}`"
+            f"🌌 Tagged **{len(player.pending_tags[user_id])}** file(s) with: `{', '.join(tags)}`"
         )
 
-        del pending_tag_uploads[guild_id][user_id]
-        save_upload_data()
+        del player.pending_tags[user_id]
+        save_upload_data(guild_id)
 
 # ========== UTILITY ==========
 
@@ -237,7 +2367,7 @@ async def help(ctx):
                 embed.title = "🏷️ Tagging – Classify Constellations"
                 embed.description = (
                     "🔖 **!tag** – Attach feelings or ideas to your songs\n"
-                    "💫 **!playbytag** – Call songs by shared celestial theme\n"
+                    "💫 **!playbytag** – Call songs by shared celestial theme (`+tag` to require, `-tag` to exclude)\n"
                     "📑 **!listtags** – Review your lyrical galaxy\n"
                     "🌿 **!removetag** – Let labels fall like leaves. Alias: untag"
                 )
@@ -329,13 +2459,14 @@ async def leave(ctx):
 @bot.command(aliases=["rinse", "purgeghosts", "reclaimstars"])
 async def cleanvoices(ctx):
     """Force EchoMond to release all ghostly voice connections."""
-    count = 0
-    for guild in bot.guilds:
-        vc = guild.voice_client
-        if vc and vc.is_connected():
-            await vc.disconnect(force=True)
-            count += 1
-    await ctx.send(f"🧼 EchoMond purged `{count}` phantom voice connection(s). All echoes... *rinsed.* 💫")
+    outcomes = await voice_reaper.reap([vc for vc in bot.voice_clients if vc.is_connected()], "cleanvoices")
+    message = f"🧼 EchoMond purged `{outcomes['ok']}` phantom voice connection(s). All echoes... *rinsed.* 💫"
+    if outcomes["timeout"] or outcomes["error"]:
+        message += (
+            f"\n🌫️ `{outcomes['timeout']}` never answered and `{outcomes['error']}` resisted — "
+            "they were let go all the same."
+        )
+    await ctx.send(message)
 
 # ========== PLAYBACK ==========
 
@@ -356,24 +2487,25 @@ async def play(ctx, url: str = None):
     await ctx.send("🔭 EchoMond tunes into your frequency...")
 
     try:
-        with youtube_dl.YoutubeDL(YDL_OPTIONS) as ydl:
-            info = ydl.extract_info(url, download=False)
-
-            if 'entries' in info:  # Playlist
-                added = 0
-                for entry in info['entries']:
-                    if entry:
-                        entry_info = (
-                            ydl.extract_info(entry['url'], download=False)
-                            if entry.get('_type') == 'url'
-                            else entry
-                        )
-                        song_queue_by_guild[guild_id].append((entry_info['webpage_url'], entry_info['title']))
-                        added += 1
-                await ctx.send(f"🌌 {added} celestial echoes added to the queue.")
-            else:  # Single video
-                song_queue_by_guild[guild_id].append((info['webpage_url'], info['title']))
-                await ctx.send(f"🎶 **{info['title']}** has been tethered to the stars.")
+        info = await ytdl.extract(guild_id, url, options=YDL_FLAT_OPTIONS)
+
+        if 'entries' in info:  # Playlist
+            entries = [entry for entry in info['entries'] if entry]
+            if not entries:
+                await ctx.send("🌘 That playlist drifts empty — no echoes to gather.")
+                return
+            status = await ctx.send(f"🌌 Gathering `{len(entries)}` celestial echoes...")
+            task = bot.loop.create_task(load_playlist(ctx, entries, status))
+            loaders = get_player(ctx.guild).playlist_loaders
+            loaders.add(task)
+            task.add_done_callback(loaders.discard)
+            return
+        else:  # Single video
+            queue = get_player(ctx.guild).queue
+            queue.append(RemoteTrack(info['webpage_url'], info['title']))
+            await ctx.send(f"🎶 **{info['title']}** has been tethered to the stars.")
+            if vc.is_playing() and len(queue) <= PREFETCH_DEPTH:
+                prefetcher.schedule(guild_id)
 
     except Exception as e:
         await ctx.send(f"⚠️ The constellations whispered of an error: `{e}`")
@@ -382,130 +2514,670 @@ async def play(ctx, url: str = None):
     if not vc.is_playing():
         await play_next(ctx)
 
-async def play_next(ctx):
-    guild_id = ctx.guild.id
-    vc = ctx.voice_client or ctx.guild.voice_client
+async def _resolve_playlist_entry(guild_id, entry):
+    if entry.get('_type') == 'url':
+        entry = await ytdl.extract(guild_id, entry['url'])
+    return RemoteTrack(entry.get('webpage_url') or entry['url'], entry.get('title') or entry['url'])
 
-    if not vc or not vc.is_connected():
-        await ctx.send("🔇 I’m untethered from sound — use `!join` to bring me into your sky.")
-        return
-
-    if not song_queue_by_guild[guild_id]:
-        await ctx.send("🌌 The queue is empty — the void hums in silence.")
-        return
+async def load_playlist(ctx, entries, status):
+    """Resolves playlist entries concurrently, queueing them in order as they arrive."""
+    guild_id = ctx.guild.id
+    queue = get_player(ctx.guild).queue
+    total = len(entries)
+    pending = iter(range(total))
+    resolved = {}
+    progress = {"next": 0, "added": 0, "failed": 0, "edited_at": 0.0}
+
+    def flush():
+        # Only the contiguous resolved prefix is queued, so playlist order holds
+        while progress["next"] in resolved:
+            song = resolved.pop(progress["next"])
+            progress["next"] += 1
+            if song is None:
+                progress["failed"] += 1
+                continue
+            queue.append(song)
+            progress["added"] += 1
+            vc = ctx.guild.voice_client
+            if progress["added"] == 1 and vc and vc.is_connected() and not (vc.is_playing() or vc.is_paused()):
+                bot.loop.create_task(play_next(ctx))
+            elif len(queue) <= PREFETCH_DEPTH:
+                prefetcher.schedule(guild_id)
+
+    async def worker():
+        for index in pending:
+            try:
+                resolved[index] = await _resolve_playlist_entry(guild_id, entries[index])
+            except Exception as e:
+                print(f"[Playlist] Could not resolve entry {index + 1}/{total}: {e}")
+                resolved[index] = None
+            flush()
 
-    usage_counters[guild_id] += 1
-    is_high_usage = usage_counters[guild_id] >= 30
+            now = bot.loop.time()
+            if now - progress["edited_at"] >= PLAYLIST_PROGRESS_INTERVAL and progress["next"] < total:
+                progress["edited_at"] = now
+                try:
+                    await status.edit(content=f"🌌 Gathering echoes... `{progress['added']}/{total}` tethered to the stars.")
+                except discord.HTTPException:
+                    pass
 
-    # Clear previous now playing
-    if last_now_playing_message_by_guild.get(guild_id):
-        try:
-            embed = last_now_playing_message_by_guild[guild_id].embeds[0]
-            embed.set_field_at(0, name="Progress", value="🌑 Echo rests. `Complete`", inline=False)
-            await last_now_playing_message_by_guild[guild_id].edit(embed=embed)
-        except Exception:
-            pass
-        last_now_playing_message_by_guild[guild_id] = None
+    await asyncio.gather(*(worker() for _ in range(min(PLAYLIST_RESOLVE_CONCURRENCY, total))))
 
+    summary = f"🌌 {progress['added']} celestial echoes added to the queue."
+    if progress["failed"]:
+        summary += f"\n🌫️ {progress['failed']} drifted beyond reach and were skipped."
     try:
-        song_data = song_queue_by_guild[guild_id].pop(0)
-    except IndexError:
-        await ctx.send("⚠️ The queue vanished mid-flight. EchoMond is puzzled.")
-        return
-
-    is_temp_youtube = False
+        await status.edit(content=summary)
+    except discord.HTTPException:
+        pass
+
+def cancel_playlist_loaders(guild_id):
+    player = players.peek(guild_id)
+    for task in list(player.playlist_loaders if player else ()):
+        task.cancel()
+
+async def resolve_track(guild_id, song_data):
+    """Turns a queue entry into a track: where its audio lives and how ffmpeg should open it."""
+    track = {
+        "song": song_data,
+        "started_at": time.perf_counter(),
+        "mode": "local",
+        "pinned": None,   # cached video ID held while playing
+        "temp": False,    # downloaded file to delete once played
+        "probe": None,
+        "offset": 0.0,
+        "stopped": False,  # set when a skip or stop cut it short, so its ending isn't mistaken for a failure
+    }
 
-    if isinstance(song_data, tuple):
+    if isinstance(song_data, RemoteTrack):
         original_url, song_title = song_data
-        try:
-            with youtube_dl.YoutubeDL(YDL_OPTIONS) as ydl:
-                info = ydl.extract_info(original_url, download=True)
-                song_url = info['requested_downloads'][0]['filepath'] if 'requested_downloads' in info else ydl.prepare_filename(info)
-                duration = info.get('duration', 0)
-                is_temp_youtube = True
-        except Exception as e:
-            await ctx.send(f"⚠️ Could not fetch audio: {e}\nSkipping to next song...")
-            return await play_next(ctx)
-        ffmpeg_options = FFMPEG_LOCAL_OPTIONS
+        video_id = youtube_video_id(original_url)
+        stream_info = None
+        cached = audio_cache.get(video_id) if video_id else None
+        if not cached and video_id and prefetcher.is_fetching(video_id):
+            cached = await prefetcher.fetch(guild_id, original_url, song_title, video_id)
+        if not cached and YTDL_STREAM and not stream_recently_failed(original_url):
+            try:
+                stream_info = await ytdl.extract(guild_id, original_url, options=YDL_STREAM_OPTIONS)
+                if not stream_info.get('url'):
+                    raise RuntimeError("no direct audio URL")
+            except Exception as e:
+                print(f"[Stream] Falling back to download for {original_url}: {e}")
+                stream_info = None
+
+        source_codec = None
+        if cached:
+            song_url, duration = cached["path"], cached["duration"]
+            source_codec = cached.get("codec")
+            track["mode"] = "cache"
+        elif stream_info:
+            song_url = stream_info['url']
+            duration = int(stream_info.get('duration') or 0)
+            source_codec = stream_info.get('acodec')
+            track["mode"] = "stream"
+        elif video_id:
+            cached = await prefetcher.fetch(guild_id, original_url, song_title, video_id)
+            song_url, duration = cached["path"], cached["duration"]
+            source_codec = cached.get("codec")
+            track["mode"] = "download"
+        else:
+            info = await ytdl.extract(guild_id, original_url, download=True)
+            song_url = info['_filepath']
+            duration = int(info.get('duration') or 0)
+            track["temp"] = True
+            track["mode"] = "download"
+        if video_id and track["mode"] != "stream":
+            audio_cache.pin(video_id)
+            track["pinned"] = video_id
+        ffmpeg_options = FFMPEG_OPTIONS if track["mode"] == "stream" else FFMPEG_LOCAL_OPTIONS
     else:
-        song_url = song_data
-        song_title = os.path.basename(song_url)
-        try:
-            audio = MP3(song_url) if song_url.endswith(".mp3") else WAVE(song_url)
-            duration = int(audio.info.length) if audio and audio.info else 0
-        except Exception:
-            duration = 0
+        song_title = song_data.filename
+        song_url, duration = local_track_source(guild_id, song_title)
+        if duration is None:
+            duration = int((await index_upload(guild_id, song_title)).get("duration") or 0)
         ffmpeg_options = FFMPEG_LOCAL_OPTIONS
+        source_codec = None
+
+    if track["mode"] != "stream" and not source_codec:
+        extension = os.path.splitext(song_url)[1].lstrip(".").lower()
+        # webm/ogg/mka may hold Opus or not; leave those to ffprobe
+        source_codec = None if extension in ("webm", "ogg", "mka", "") else extension
+
+    track.update(title=song_title, url=song_url, duration=duration, ffmpeg_options=ffmpeg_options, codec=source_codec)
+    return track
+
+def release_track(track):
+    """Lets go of whatever a finished (or abandoned) track was holding on disk."""
+    if track["pinned"]:
+        audio_cache.unpin(track["pinned"])
+        track["pinned"] = None
+    if track["temp"] and os.path.exists(track["url"]):
+        try:
+            os.remove(track["url"])
+        except Exception as e:
+            print(f"[Cleanup Error] Could not delete file: {e}")
 
-    def after_play(error):
-        if error:
-            print(f"⚠️ Playback error: {error}")
-        if is_temp_youtube and os.path.exists(song_url):
-            try:
-                os.remove(song_url)
-            except Exception as e:
-                print(f"[Cleanup Error] Could not delete file: {e}")
-        # Only continue if still connected and queue has songs
-        if ctx.guild.voice_client and song_queue_by_guild[guild_id]:
-            bot.loop.create_task(play_next(ctx))
-        elif not song_queue_by_guild[guild_id]:
-            coro = ctx.send("🌌 The last echo fades... the stardust settles. The queue is empty.")
-            bot.loop.create_task(coro)
+class GuildPlayer:
+    """One guild's playback state machine, fed by an event queue.
 
-    if vc and vc.is_connected():
-        vc.play(discord.FFmpegPCMAudio(song_url, **ffmpeg_options), after=after_play)
-        vol = volume_levels_by_guild.get(guild_id, 1.0)
-        vc.source = discord.PCMVolumeTransformer(vc.source, volume=vol if vol > 0 else 1.0)
-    else:
-        await ctx.send("💥 EchoMond lost connection mid-orbit. Please call `!join` again.")
-        return
+    Commands post events and return at once; a single runner task per guild
+    applies them in order. Resolving happens in its own task, so a slow
+    download never holds up a skip or stop, and every message the player
+    sends is driven by one of its own transitions.
 
-    def cosmic_progress_bar(current, total, segments=10):
-        moon_phases = ["🌑", "🌒", "🌓", "🌔", "🌕", "🌖", "🌗", "🌘", "🌑", "🌑"]
-        filled = int((current / total) * segments) if total else 0
-        return ''.join(moon_phases[i] if i < filled else "🌑" for i in range(segments))
+        idle ──play──▶ resolving ──resolved──▶ playing ◀──pause/resume──▶ paused
+          ▲                │                      │
+          └──── stop ──────┴────── track_end ─────┘ (advances if the queue has more)
+    """
 
-    embed = discord.Embed(
-        title="🌙 EchoMond – Moonbound Melody",
-        description=f"🎶 **{song_title}** emerges beneath starlit skies.",
-        color=0xb9a1ff
+    IDLE, RESOLVING, PLAYING, PAUSED = "idle", "resolving", "playing", "paused"
+
+    __slots__ = (
+        "guild", "guild_id", "state", "events", "runner", "resolver", "token", "current", "ctx", "ended_at",
+        "queue", "volume", "now_playing_message", "playlist_loaders", "pending_tags", "last_active",
     )
 
-    if duration:
-        embed.add_field(name="Progress", value=f"{cosmic_progress_bar(0, duration)} `0:00 / {duration // 60}:{duration % 60:02d}`", inline=False)
+    def __init__(self, guild):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.state = self.IDLE
+        self.events = asyncio.Queue()
+        self.runner = None
+        self.resolver = None
+        self.token = 0        # bumps on every advance so stale resolves are ignored
+        self.current = None   # the track handed to the voice client
+        self.ctx = None       # where the player speaks
+        self.ended_at = None  # when the previous track ended, until the next one sounds
+        self.queue = SongQueue()
+        self.volume = 1.0
+        self.now_playing_message = None
+        self.playlist_loaders = set()
+        self.pending_tags = {}  # {user_id: [filenames]} awaiting a tag reply
+        self.last_active = time.monotonic()
+
+    def is_idle(self):
+        """Nothing playing, loading or waiting to be handled."""
+        return (
+            self.state == self.IDLE and self.events.empty() and not self.playlist_loaders
+            and (self.runner is None or self.runner.done()) and (self.resolver is None or self.resolver.done())
+        )
 
-    message = await ctx.send(embed=embed)
-    last_now_playing_message_by_guild[guild_id] = message
+    def post(self, event, ctx=None, **data):
+        if ctx is not None:
+            self.ctx = ctx
+        self.last_active = time.monotonic()
+        self.events.put_nowait((event, data))
+        if self.runner is None or self.runner.done():
+            self.runner = bot.loop.create_task(self._run())
+
+    async def _run(self):
+        while not self.events.empty():
+            event, data = self.events.get_nowait()
+            try:
+                await getattr(self, f"on_{event}")(**data)
+            except Exception as e:
+                print(f"[Player] '{event}' failed in guild {self.guild_id}: {e}")
 
-    if duration and not is_high_usage:
-        for second in range(1, duration + 1):
-            if second % 10 == 0 or second == duration:
-                bar = cosmic_progress_bar(second, duration)
-                timestamp = f"{second // 60}:{second % 60:02d} / {duration // 60}:{duration % 60:02d}"
-                try:
-                    embed.set_field_at(0, name="Progress", value=f"{bar} `{timestamp}`", inline=False)
-                    await message.edit(embed=embed)
-                except discord.HTTPException:
-                    pass
-            await asyncio.sleep(1)
+    def say(self, content):
+        if self.ctx:
+            bot.loop.create_task(self._send(content))
 
+    async def _send(self, content):
         try:
-            embed.title = "🌌 Fadeout"
-            embed.description = f"**{song_title}** drifts into cosmic silence."
-            embed.set_field_at(0, name="Progress", value="🌕🌕🌕🌕🌕🌕🌕🌕🌕🌕 `Finished`", inline=False)
-            await message.edit(embed=embed)
+            await self.ctx.send(content)
         except discord.HTTPException:
             pass
 
-        await asyncio.sleep(6)
+    def _on_first_frame(self, track):
+        """Runs on the audio thread when a new track's first frame goes out."""
+        record_ttfa(track["mode"], track["started_at"])
+        ended_at, self.ended_at = self.ended_at, None
+        if ended_at is not None:
+            record_transition(self.guild_id, ended_at)
+
+    # 🌠 Events
+
+    async def on_play(self):
+        if self.state == self.IDLE:
+            self._advance()
+
+    async def on_skip(self):
+        vc = self.guild.voice_client
+        if self.state in (self.PLAYING, self.PAUSED) and vc:
+            if self.current:
+                self.current["stopped"] = True
+            vc.stop()  # the track_end that follows advances the queue
+        elif self.state == self.RESOLVING:
+            self.resolver.cancel()
+            self._advance()
+        else:
+            self._advance()
+
+    async def on_stop(self):
+        if self.resolver:
+            self.resolver.cancel()
+        self.token += 1
+        self.ended_at = None
+        progress.stop(self.guild_id)
+        track, self.current = self.current, None
+        if track:
+            track["stopped"] = True
+            release_track(track)
+        vc = self.guild.voice_client
+        if vc and (vc.is_playing() or vc.is_paused()):
+            vc.stop()
+        self.state = self.IDLE
+
+    async def on_pause(self):
+        vc = self.guild.voice_client
+        if self.state == self.PLAYING and vc and vc.is_playing():
+            vc.pause()
+            self.state = self.PAUSED
+
+    async def on_resume(self):
+        vc = self.guild.voice_client
+        if self.state == self.PAUSED and vc and vc.is_paused():
+            vc.resume()
+            self.state = self.PLAYING
+
+    async def on_volume(self):
+        vc = self.guild.voice_client
+        if self.current and vc:
+            await apply_volume(vc, self.guild_id, self.current)
+
+    async def on_resolved(self, track, token):
+        if token != self.token:
+            release_track(track)
+            return
+        self.resolver = None
+        vc = self.guild.voice_client
+        if not vc or not vc.is_connected():
+            release_track(track)
+            self.state = self.IDLE
+            self.say("💥 EchoMond lost connection mid-orbit. Please call `!join` again.")
+            return
 
+        track["after"] = lambda error, probe: self._after(track, error, probe)
+        self.current = track
         try:
-            embed.set_field_at(0, name="Progress", value="🌙 The glow fades gently... `Complete`", inline=False)
-            await message.edit(embed=embed)
+            await start_track_source(vc, self.guild_id, track, on_first_frame=lambda: self._on_first_frame(track))
+        except Exception as e:
+            self.current = None
+            release_track(track)
+            self.say(f"⚠️ Could not start audio: {e}\nSkipping to next song...")
+            self._advance()
+            return
+        self.state = self.PLAYING
+        prefetcher.schedule(self.guild_id)
+        bot.loop.create_task(self._show_now_playing(track))
+
+    async def on_resolve_failed(self, error, token):
+        if token != self.token:
+            return
+        self.resolver = None
+        self.say(f"⚠️ Could not fetch audio: {error}\nSkipping to next song...")
+        self._advance()
+
+    async def on_track_end(self, track, error, started, ended_at):
+        handoff = time.perf_counter() - ended_at
+        metrics.observe("echomond_handoff_seconds", handoff)
+        if handoff > TRANSITION_WARN_SECONDS:
+            print(f"[Transition] 🐢 Guild {self.guild_id} waited {handoff:.2f}s for the track-end handoff.")
+        if track is not self.current:
+            return  # stopped or replaced already
+        self.current = None
+        self.state = self.IDLE
+        progress.finish(self.guild_id, track)
+        release_track(track)
+
+        if track["mode"] == "stream" and not track["stopped"] and (error or not started):
+            # The stream never produced audio on its own — retry this song through the download path
+            print(f"[Stream] No audio from stream, retrying via download: {track['title']}")
+            note_stream_failure(track["song"].url)
+            self.queue.appendleft(track["song"])
+
+        # Only continue if still connected and queue has songs
+        vc = self.guild.voice_client
+        if vc and vc.is_connected() and self.queue:
+            self.ended_at = ended_at
+            self._advance()
+        elif not self.queue:
+            self.say("🌌 The last echo fades... the stardust settles. The queue is empty.")
+
+    # 🌙 Transitions
+
+    def _after(self, track, error, probe):
+        """Runs on the voice client's audio thread when a source ends.
+
+        The thread only signals: the event is handed to the loop thread-safely
+        and the guild's runner, the only consumer, does all the work.
+        """
+        if probe.superseded:
+            return  # the source was swapped (volume change); the track itself goes on
+        if error:
+            print(f"⚠️ Playback error: {error}")
+        event = {"track": track, "error": error, "started": probe.started, "ended_at": time.perf_counter()}
+        try:
+            bot.loop.call_soon_threadsafe(lambda: self.post("track_end", **event))
+        except RuntimeError:
+            pass  # the loop is closing; nothing left to advance
+
+    def _advance(self):
+        vc = self.guild.voice_client
+        self.state = self.IDLE
+        if not vc or not vc.is_connected():
+            self.say("🔇 I’m untethered from sound — use `!join` to bring me into your sky.")
+            return
+        queue = self.queue
+        if not queue:
+            self.say("🌌 The queue is empty — the void hums in silence.")
+            return
+
+        # Clear previous now playing
+        progress.stop(self.guild_id)
+        self.now_playing_message = None
+
+        self.token += 1
+        self.state = self.RESOLVING
+        self.resolver = bot.loop.create_task(self._resolve(queue.popleft(), self.token))
+
+    async def _resolve(self, song_data, token):
+        try:
+            track = await resolve_track(self.guild_id, song_data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.post("resolve_failed", error=e, token=token)
+        else:
+            self.post("resolved", track=track, token=token)
+
+    async def _show_now_playing(self, track):
+        song_title, duration = track["title"], track["duration"]
+        embed = discord.Embed(
+            title="🌙 EchoMond – Moonbound Melody",
+            description=f"🎶 **{song_title}** emerges beneath starlit skies.",
+            color=0xb9a1ff
+        )
+
+        if duration:
+            embed.add_field(name="Progress", value=f"{cosmic_progress_bar(0, duration)} `{format_progress(0, duration)}`", inline=False)
+
+        try:
+            message = await self.ctx.send(embed=embed)
         except discord.HTTPException:
-            pass
-    else:
-        await message.edit(content=f"▶️ Now playing: **{song_title}**")
+            return
+        self.now_playing_message = message
+
+        if duration and self.current is track:
+            progress.start(self.guild_id, message, embed, song_title, duration, track)
+        elif not duration:
+            await message.edit(content=f"▶️ Now playing: **{song_title}**")
+
+# 🛰️ Player registry — per-guild state lives on its player, made on demand and let go when idle
+PLAYER_IDLE_SECONDS = int(os.getenv("PLAYER_IDLE_SECONDS", "900"))
+PLAYER_SWEEP_SECONDS = 60
+
+class PlayerRegistry:
+    """The guilds in use right now, each with its GuildPlayer.
+
+    A player is made the first time a guild needs one. After
+    PLAYER_IDLE_SECONDS without activity it is evicted: its voice connection
+    is closed, its queue goes with it, and the guild's library is unloaded
+    if nothing is waiting to be saved. Libraries loaded without a player
+    (uploads, listing commands) are unloaded after the same idle time.
+    Memory follows the guilds in use, not every guild ever seen.
+    """
+
+    def __init__(self, idle_seconds):
+        self.players = {}  # {guild_id: GuildPlayer}
+        self.idle_seconds = idle_seconds
+        self.evicted = 0
+        self.task = None
+
+    def __len__(self):
+        return len(self.players)
+
+    def get(self, guild):
+        player = self.players.get(guild.id)
+        if player is None:
+            player = self.players[guild.id] = GuildPlayer(guild)
+        player.last_active = time.monotonic()
+        return player
+
+    def peek(self, guild_id):
+        """The guild's player if it has one; never makes one."""
+        return self.players.get(guild_id)
+
+    def values(self):
+        return self.players.values()
+
+    def items(self):
+        return self.players.items()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self._sweep())
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(PLAYER_SWEEP_SECONDS)
+            now = time.monotonic()
+            idle = [guild_id for guild_id, player in self.players.items()
+                    if player.is_idle() and now - player.last_active > self.idle_seconds]
+            # Evicted together: each voice disconnect is bounded by the reaper, so one hung guild can't hold up the rest
+            results = await asyncio.gather(*(self.evict(guild_id) for guild_id in idle), return_exceptions=True)
+            for guild_id, result in zip(idle, results):
+                if isinstance(result, Exception):
+                    print(f"[Players] Could not evict guild {guild_id}: {result}")
+            for guild_id in list(library_loaded):
+                if guild_id not in self.players and now - library_used_at.get(guild_id, 0) > self.idle_seconds:
+                    unload_guild_library(guild_id)
+
+    async def evict(self, guild_id):
+        player = self.players.pop(guild_id, None)
+        if player is None:
+            return
+        prefetcher.cancel(guild_id)
+        progress.stop(guild_id)
+        vc = player.guild.voice_client
+        if vc and vc.is_connected():
+            await voice_reaper.disconnect(vc)
+            print(f"[Players] 🌙 Left the quiet sky of {player.guild.name} ({guild_id}).")
+        unload_guild_library(guild_id)
+        self.evicted += 1
+
+players = PlayerRegistry(PLAYER_IDLE_SECONDS)
+
+def get_player(guild):
+    return players.get(guild)
+
+# 🪦 Voice reaper — many disconnects at once, and no slow one holds up the rest
+VOICE_REAP_CONCURRENCY = int(os.getenv("VOICE_REAP_CONCURRENCY", "16"))
+VOICE_DISCONNECT_TIMEOUT = float(os.getenv("VOICE_DISCONNECT_TIMEOUT", "5"))
+VOICE_REAP_INTERVAL = int(os.getenv("VOICE_REAP_INTERVAL", "60"))
+
+class VoiceReaper:
+    """Disconnects voice clients concurrently, a bounded number at a time, each with its own timeout.
+
+    A connection that won't close in time (or errors) is cleaned up locally
+    so it can't linger. Every VOICE_REAP_INTERVAL it also looks for
+    connections that died without saying so: still registered but no longer
+    connected, or "playing" while no audio frames move, on two checks in a row.
+    """
+
+    def __init__(self, concurrency, timeout):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.totals = Counter()  # {"ok" | "timeout" | "error": count}
+        self.suspects = {}  # {guild_id: what looked dead on the last check}
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self._run())
+
+    async def disconnect(self, vc):
+        """Disconnects one voice client; returns "ok", "timeout" or "error"."""
+        async with self.slots:
+            try:
+                await asyncio.wait_for(vc.disconnect(force=True), self.timeout)
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+            except Exception as e:
+                print(f"[Voice] Could not disconnect in {vc.guild.name} ({vc.guild.id}): {e}")
+                outcome = "error"
+        if outcome != "ok":
+            try:
+                vc.cleanup()  # forget it locally even though Discord never answered
+            except Exception:
+                pass
+        voice_supervisor.forget(vc.guild.id)
+        self.totals[outcome] += 1
+        return outcome
+
+    async def reap(self, voice_clients, reason):
+        """Disconnects them all concurrently; returns a Counter of outcomes."""
+        voice_clients = list(voice_clients)
+        if not voice_clients:
+            return Counter()
+        outcomes = Counter(await asyncio.gather(*(self.disconnect(vc) for vc in voice_clients)))
+        print(
+            f"[Voice] 🪦 Reaped {len(voice_clients)} connection(s) ({reason}): "
+            f"{outcomes['ok']} ok, {outcomes['timeout']} timed out, {outcomes['error']} failed."
+        )
+        return outcomes
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(VOICE_REAP_INTERVAL)
+            dead = []
+            for vc in list(bot.voice_clients):
+                guild_id = vc.guild.id
+                if not vc.is_connected():
+                    sign = "disconnected"
+                elif vc.is_playing():
+                    sign = getattr(vc.source, "frames", None)  # frozen frame count: the audio thread is stuck
+                else:
+                    sign = None
+                if sign is None:
+                    self.suspects.pop(guild_id, None)
+                elif self.suspects.get(guild_id) == sign:
+                    del self.suspects[guild_id]
+                    dead.append(vc)
+                else:
+                    self.suspects[guild_id] = sign
+
+            for vc in dead:
+                player = players.peek(vc.guild.id)
+                if player:
+                    player.post("stop")
+            if dead:
+                await self.reap(dead, "silently dead")
+
+voice_reaper = VoiceReaper(VOICE_REAP_CONCURRENCY, VOICE_DISCONNECT_TIMEOUT)
+
+# 🔕 Idle voice supervisor — a voice connection lasts only as long as someone is listening
+VOICE_EMPTY_TIMEOUT = int(os.getenv("VOICE_EMPTY_TIMEOUT", "120"))  # seconds alone in the channel; 0 disables
+VOICE_SILENCE_TIMEOUT = int(os.getenv("VOICE_SILENCE_TIMEOUT", "900"))  # seconds without playing; 0 disables
+VOICE_CHECK_SECONDS = 15
+
+class VoiceSupervisor:
+    """Disconnects voice clients that nobody is listening to.
+
+    ``empty_since`` follows on_voice_state_update, so a channel that empties
+    (or fills again) is noticed at once; ``silent_since`` follows whether the
+    voice client is playing. A periodic check lets go of any connection past
+    its timeout and keeps the active/idle counts current.
+    """
+
+    def __init__(self, empty_timeout, silence_timeout):
+        self.empty_timeout = empty_timeout
+        self.silence_timeout = silence_timeout
+        self.empty_since = {}   # {guild_id: monotonic time the last listener left}
+        self.silent_since = {}  # {guild_id: monotonic time playback stopped}
+        self.disconnects = Counter()  # {"empty" | "silent": count}
+        self.last_counts = None
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self._run())
+
+    @staticmethod
+    def listeners(channel):
+        return [member for member in channel.members if not member.bot]
+
+    def observe(self, guild):
+        """Refreshes a guild's timers from its voice client and channel."""
+        vc = guild.voice_client
+        if not vc or not vc.is_connected():
+            self.forget(guild.id)
+            return
+        now = time.monotonic()
+        if self.listeners(vc.channel):
+            self.empty_since.pop(guild.id, None)
+        else:
+            self.empty_since.setdefault(guild.id, now)
+        if vc.is_playing():
+            self.silent_since.pop(guild.id, None)
+        else:
+            self.silent_since.setdefault(guild.id, now)
+
+    def forget(self, guild_id):
+        self.empty_since.pop(guild_id, None)
+        self.silent_since.pop(guild_id, None)
+
+    def counts(self):
+        """Connected voice clients in this process: playing ("active") versus not ("idle")."""
+        connected = [vc for vc in bot.voice_clients if vc.is_connected()]
+        active = sum(1 for vc in connected if vc.is_playing())
+        return {"active": active, "idle": len(connected) - active}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(VOICE_CHECK_SECONDS)
+            now = time.monotonic()
+            for vc in list(bot.voice_clients):
+                guild = vc.guild
+                self.observe(guild)
+                if self.empty_timeout and now - self.empty_since.get(guild.id, now) >= self.empty_timeout:
+                    bot.loop.create_task(self.release(guild, "empty"))
+                elif self.silence_timeout and now - self.silent_since.get(guild.id, now) >= self.silence_timeout:
+                    bot.loop.create_task(self.release(guild, "silent"))
+
+            counts = self.counts()
+            if counts != self.last_counts:
+                self.last_counts = counts
+                print(f"[Voice] 🎧 {counts['active']} active, {counts['idle']} idle voice connection(s).")
+
+    async def release(self, guild, reason):
+        self.forget(guild.id)
+        player = players.peek(guild.id)
+        if player:
+            player.post("stop")
+            player.say(
+                "🌙 The sky emptied, so EchoMond drifted home." if reason == "empty"
+                else "🌙 The stars fell quiet for a long while, so EchoMond drifted home."
+            )
+        vc = guild.voice_client
+        if vc and vc.is_connected():
+            await voice_reaper.disconnect(vc)
+        self.disconnects[reason] += 1
+        print(f"[Voice] 🔕 Left {guild.name} ({guild.id}): {'no listeners' if reason == 'empty' else 'silence'}.")
+
+voice_supervisor = VoiceSupervisor(VOICE_EMPTY_TIMEOUT, VOICE_SILENCE_TIMEOUT)
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    if member.id == bot.user.id and after.channel is None:
+        voice_supervisor.forget(member.guild.id)
+    elif before.channel != after.channel and member.guild.voice_client:
+        voice_supervisor.observe(member.guild)
+
+async def play_next(ctx):
+    """Asks the guild's player to start the queue if it's idle; never waits for playback."""
+    get_player(ctx.guild).post("play", ctx)
 
 @bot.command(aliases=["hush"])
 async def pause(ctx):
@@ -515,7 +3187,7 @@ async def pause(ctx):
         await ctx.send("🔇 I’m not resonating with your skies right now. Use `!join` to summon me first.")
         return
     if vc.is_playing():
-        vc.pause()
+        get_player(ctx.guild).post("pause", ctx)
         await ctx.send("🌑 The music slips into a lunar hush.")
     else:
         await ctx.send("🤫 There's no melody to silence — the void sings on its own.")
@@ -528,7 +3200,7 @@ async def resume(ctx):
         await ctx.send("🔇 I float in silence, untethered. Use `!join` to awaken the melody.")
         return
     if vc.is_paused():
-        vc.resume()
+        get_player(ctx.guild).post("resume", ctx)
         await ctx.send("🌔 The pulse returns — starlight rising in rhythm once more.")
     else:
         await ctx.send("🎵 I’m already playing the music of the spheres — no need to resume.")
@@ -537,11 +3209,10 @@ async def resume(ctx):
 async def skip(ctx):
     """Skips the current song with a stardust swirl."""
     if ctx.voice_client and ctx.voice_client.is_playing():
-        ctx.voice_client.stop()
         await ctx.send("🌠 A star blinks out — skipping to the next celestial note.")
     else:
         await ctx.send("🌑 There's no melody to skip... silence echoes.")
-    await play_next(ctx)
+    get_player(ctx.guild).post("skip", ctx)
 
 @bot.command(aliases=["again", "rewind", "repeat", "encore"])
 async def replay(ctx):
@@ -553,7 +3224,8 @@ async def replay(ctx):
         await ctx.send("🔇 I drift untethered — call `!join` to bring me close again.")
         return
 
-    last_message = last_now_playing_message_by_guild.get(guild_id)
+    player = players.peek(guild_id)
+    last_message = player.now_playing_message if player else None
     if not last_message:
         await ctx.send("🌑 I can’t echo what hasn’t been sung. No track to replay.")
         return
@@ -573,15 +3245,14 @@ async def replay(ctx):
         return
 
     # Search for it in uploaded files (by filename match)
-    uploaded_files = uploaded_files_by_guild.get(guild_id, [])
-    match = next((f for f in uploaded_files if song_title in f), None)
+    match = next((f for f in track_registry_by_guild[guild_id] if song_title in f), None)
 
     if not match:
         await ctx.send("💫 That melody has drifted out of the archive... I can't find it.")
         return
 
-    song_path = os.path.join(MUSIC_FOLDER, match)
-    song_queue_by_guild[guild_id].insert(0, song_path)
+    registry = track_registry_by_guild[guild_id]
+    player.queue.appendleft(registry.entry(registry.id_of(match)))
     await ctx.send(f"🔄 **{song_title}** spins once more through the cosmos...")
 
     if not vc.is_playing():
@@ -593,16 +3264,20 @@ async def stop(ctx):
     guild_id = ctx.guild.id
 
     # Clear the queue first
-    queue = song_queue_by_guild.get(guild_id, [])
-    queue.clear()
+    cancel_playlist_loaders(guild_id)
+    prefetcher.cancel(guild_id)
+    player = players.peek(guild_id)
+    if player is None:
+        await ctx.send("🌌 Already silent… and no queue drifts here to sweep.")
+        return
+    player.queue.clear()
 
-    # Reset usage tracking or "now playing" state if you track those too
-    last_now_playing_message_by_guild[guild_id] = None
-    usage_counters[guild_id] = 0
+    # Reset the "now playing" state; the player stops the song and its progress updates
+    player.now_playing_message = None
+    was_playing = ctx.voice_client and ctx.voice_client.is_playing()
+    player.post("stop", ctx)
 
-    # Stop the current song if playing
-    if ctx.voice_client and ctx.voice_client.is_playing():
-        ctx.voice_client.stop()
+    if was_playing:
         await ctx.send("🌑 Playback stilled — the stars fall quiet.")
     else:
         await ctx.send("🌌 Already silent… but your queue has been swept like cosmic dust.")
@@ -612,7 +3287,9 @@ async def volume(ctx, level: int):
     """🔊 Adjust the magnitude of the wave."""
     if ctx.voice_client and ctx.voice_client.source:
         if 0 <= level <= 200:
-            ctx.voice_client.source.volume = level / 100
+            player = get_player(ctx.guild)
+            player.volume = level / 100
+            player.post("volume", ctx)
 
             if level == 100:
                 msg = "🎼 Balanced in starlight. EchoMond flows at perfect harmony."
@@ -639,10 +3316,12 @@ async def volume(ctx, level: int):
 async def shuffle(ctx):
     """Shuffles the current music queue with lunar grace."""
     guild_id = ctx.guild.id
-    queue = song_queue_by_guild.get(guild_id, [])
+    player = players.peek(guild_id)
+    queue = player.queue if player else ()
 
     if len(queue) > 1:
-        random.shuffle(queue)
+        queue.shuffle()
+        prefetcher.schedule(guild_id)
         await ctx.send("🔀 The starlit playlist realigns — let the cosmos surprise you.")
     else:
         await ctx.send("🌘 Not enough echoes to twist the thread — add more moonlight.")
@@ -652,7 +3331,8 @@ async def queue(ctx):
     """Displays the current queue with cosmic pagination and moonlit shuffle."""
     guild_id = ctx.guild.id
 
-    if not song_queue_by_guild[guild_id]:
+    player = players.peek(guild_id)
+    if not player or not player.queue:
         await ctx.send("🌌 The queue drifts silent... no songs orbit yet.")
         return
 
@@ -663,14 +3343,19 @@ async def queue(ctx):
             self.page = 0
             self.items_per_page = 10
 
+        def current_queue(self):
+            """The guild's queue, or nothing if its player has since been evicted."""
+            player = players.peek(self.guild_id)
+            return player.queue if player else ()
+
         async def send_page(self, interaction=None, message=None):
-            queue = song_queue_by_guild[self.guild_id]
+            queue = self.current_queue()
             start = self.page * self.items_per_page
             end = start + self.items_per_page
             page_items = queue[start:end]
 
             queue_display = '\n'.join([
-                f"{i+1}. {os.path.basename(song[1]) if isinstance(song, tuple) else os.path.basename(song)}"
+                f"{i+1}. {song.title}"
                 for i, song in enumerate(page_items, start=start)
             ])
 
@@ -694,7 +3379,7 @@ async def queue(ctx):
 
         @discord.ui.button(label="➡️ Next", style=discord.ButtonStyle.blurple)
         async def next_page(self, interaction: discord.Interaction, button: Button):
-            queue = song_queue_by_guild[self.guild_id]
+            queue = self.current_queue()
             max_pages = (len(queue) - 1) // self.items_per_page
             if self.page < max_pages:
                 self.page += 1
@@ -702,8 +3387,10 @@ async def queue(ctx):
 
         @discord.ui.button(label="🌗 Shuffle", style=discord.ButtonStyle.green)
         async def shuffle_queue(self, interaction: discord.Interaction, button: Button):
-            queue = song_queue_by_guild[self.guild_id]
-            random.shuffle(queue)
+            queue = self.current_queue()
+            if queue:
+                queue.shuffle()
+                prefetcher.schedule(self.guild_id)
             self.page = 0
             await interaction.response.send_message("🌠 The stars have realigned — queue reshuffled.", ephemeral=True)
             await self.send_page(interaction)
@@ -715,7 +3402,11 @@ async def queue(ctx):
 async def clearqueue(ctx):
     """Clears the music queue for this server only."""
     guild_id = ctx.guild.id
-    song_queue_by_guild[guild_id] = []
+    cancel_playlist_loaders(guild_id)
+    prefetcher.cancel(guild_id)
+    player = players.peek(guild_id)
+    if player:
+        player.queue.clear()
 
     await ctx.send("🌌 The queue is now a blank sky — ready for new constellations.")
 
@@ -725,33 +3416,44 @@ async def clearqueue(ctx):
 async def listsongs(ctx):
     """Lists uploaded songs with pagination, tagging filters, and celestial controls."""
     guild_id = ctx.guild.id
-    uploaded_files = uploaded_files_by_guild.get(guild_id, [])
-    file_tags = file_tags_by_guild.get(guild_id, {})
+    registry = track_registry_by_guild[guild_id]
+    tag_index = tag_index_by_guild[guild_id]
 
-    if not uploaded_files:
+    if not registry:
         await ctx.send("☁️ No starlit uploads found yet — offer a melody to the cosmos.")
         return
 
     per_page = 10
 
+    # Numbers are fixed when the list opens, so they hold for as long as the buttons do
+    listing = registry.snapshot()
+    numbers = {track_id: number for number, track_id in enumerate(listing, 1)}
+    names = {track_id: registry.filename(track_id) for track_id in listing}
+
     class State:
         def __init__(self):
             self.current_page = 0
-            self.filtered_files = uploaded_files[:]
+            self.filtered_ids = listing[:]
             self.selected_tag = None
 
     state = State()
 
+    def page_entries():
+        """Queue entries for the current page's tracks that are still in the library."""
+        start = state.current_page * per_page
+        page = state.filtered_ids[start:start + per_page]
+        return [registry.entry(track_id) for track_id in page if registry.filename(track_id)]
+
     def get_page_embed():
         start = state.current_page * per_page
         end = start + per_page
-        page = state.filtered_files[start:end]
+        page = state.filtered_ids[start:end]
         song_list = "\n".join(
-            f"{start + i + 1}. {song or '[Unknown]'}"
-            for i, song in enumerate(page)
+            f"{numbers[track_id]}. {names[track_id] or '[Unknown]'}"
+            for track_id in page
         ) or "☁️ No songs found on this page."
 
-        total_pages = max(1, math.ceil(len(state.filtered_files) / per_page))
+        total_pages = max(1, math.ceil(len(state.filtered_ids) / per_page))
         tag_title = f" – Tag: {state.selected_tag}" if state.selected_tag else ""
         embed = discord.Embed(
             title=f"📂 Uploaded Songs{tag_title} (Page {state.current_page + 1}/{total_pages})",
@@ -763,10 +3465,7 @@ async def listsongs(ctx):
 
     class TagSelector(discord.ui.Select):
         def __init__(self):
-            all_tags = sorted(set(
-                tag for tags in file_tags.values() if tags
-                for tag in tags
-            ))
+            all_tags = sorted(tag_index.all_tags())
             options = [discord.SelectOption(label="All Songs", value="all")] + [
                 discord.SelectOption(label=tag, value=tag) for tag in all_tags[:24]
             ]
@@ -776,9 +3475,11 @@ async def listsongs(ctx):
             choice = self.values[0]
             state.selected_tag = None if choice == "all" else choice
             state.current_page = 0
-            state.filtered_files = [
-                f for f in uploaded_files if state.selected_tag in (file_tags.get(f) or [])
-            ] if state.selected_tag else uploaded_files[:]
+            if state.selected_tag:
+                tagged = (registry.id_of(filename) for filename in tag_index.files_with(state.selected_tag))
+                state.filtered_ids = sorted((track_id for track_id in tagged if track_id in numbers), key=numbers.get)
+            else:
+                state.filtered_ids = listing[:]
             await interaction.response.edit_message(embed=get_page_embed(), view=view)
 
     class PaginationView(discord.ui.View):
@@ -801,14 +3502,11 @@ async def listsongs(ctx):
 
         @discord.ui.button(label="▶️ Play This Page", style=discord.ButtonStyle.green, row=1)
         async def play_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-            start = state.current_page * per_page
-            end = start + per_page
-            for filename in state.filtered_files[start:end]:
-                song_path = os.path.join(MUSIC_FOLDER, filename)
-                song_queue_by_guild[guild_id].append(song_path)
+            page = page_entries()
+            get_player(ctx.guild).queue.extend(page)
 
             await interaction.response.send_message(
-                f"🎶 {end - start} melodies stirred from the ether.\n🌌 EchoMond listens, and the cosmos hums in reply...",
+                f"🎶 {len(page)} melodies stirred from the ether.\n🌌 EchoMond listens, and the cosmos hums in reply...",
                 ephemeral=True
             )
 
@@ -824,14 +3522,9 @@ async def listsongs(ctx):
 
         @discord.ui.button(label="🔀 Shuffle Page", style=discord.ButtonStyle.primary, row=1)
         async def shuffle_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-            start = state.current_page * per_page
-            end = start + per_page
-            page = state.filtered_files[start:end]
+            page = page_entries()
             random.shuffle(page)
-
-            for filename in page:
-                song_path = os.path.join(MUSIC_FOLDER, filename)
-                song_queue_by_guild[guild_id].append(song_path)
+            get_player(ctx.guild).queue.extend(page)
 
             await interaction.response.send_message(
                 f"🔀 {len(page)} tracks shuffled and queued beneath the stars.",
@@ -850,7 +3543,7 @@ async def listsongs(ctx):
 
         @discord.ui.button(label="⏭️ Next", style=discord.ButtonStyle.blurple, row=1)
         async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-            total_pages = max(1, math.ceil(len(state.filtered_files) / per_page))
+            total_pages = max(1, math.ceil(len(state.filtered_ids) / per_page))
             if state.current_page < total_pages - 1:
                 state.current_page += 1
                 await interaction.response.edit_message(embed=get_page_embed(), view=self)
@@ -867,7 +3560,7 @@ async def listsongs(ctx):
 
                 async def on_submit(modal_self, modal_interaction: discord.Interaction):
                     try:
-                        total_pages = max(1, math.ceil(len(state.filtered_files) / per_page))
+                        total_pages = max(1, math.ceil(len(state.filtered_ids) / per_page))
                         page_num = int(str(modal_self.page).strip())
                         if 1 <= page_num <= total_pages:
                             state.current_page = page_num - 1
@@ -888,8 +3581,8 @@ async def listsongs(ctx):
 async def playbynumber(ctx, *numbers):
     """Plays one or more uploaded songs using their numerical index."""
     guild_id = ctx.guild.id
-    uploaded_files = uploaded_files_by_guild.get(guild_id, [])
-    song_queue = song_queue_by_guild.setdefault(guild_id, [])
+    registry = track_registry_by_guild[guild_id]
+    song_queue = get_player(ctx.guild).queue
     added_songs = []
 
     if not numbers:
@@ -899,11 +3592,10 @@ async def playbynumber(ctx, *numbers):
     for num in numbers:
         try:
             index = int(num.strip(","))
-            if 1 <= index <= len(uploaded_files):
-                filename = uploaded_files[index - 1]
-                song_path = os.path.join(MUSIC_FOLDER, filename)
-                song_queue.append(song_path)
-                added_songs.append(filename)
+            track_id = registry.at(index)
+            if track_id is not None:
+                song_queue.append(registry.entry(track_id))
+                added_songs.append(registry.filename(track_id))
             else:
                 await ctx.send(f"☄️ `{index}` drifts beyond your orbit. Use `!listsongs` to align.")
         except ValueError:
@@ -926,15 +3618,15 @@ async def playbynumber(ctx, *numbers):
 async def playalluploads(ctx):
     """Adds all uploaded songs to the queue in a cosmic shuffle."""
     guild_id = ctx.guild.id
-    uploaded_files = uploaded_files_by_guild.get(guild_id, [])
-    song_queue = song_queue_by_guild.setdefault(guild_id, [])
+    registry = track_registry_by_guild[guild_id]
+    song_queue = get_player(ctx.guild).queue
 
-    if not uploaded_files:
+    if not registry:
         await ctx.send("🌘 No celestial notes found — upload a tune to begin.")
         return
 
     # Filter out any None or blank filenames
-    valid_files = [f for f in uploaded_files if f and isinstance(f, str)]
+    valid_files = [f for f in registry if f and isinstance(f, str)]
 
     if not valid_files:
         await ctx.send("🪐 I tried, but found only echoes of silence. No usable uploads.")
@@ -943,8 +3635,7 @@ async def playalluploads(ctx):
     random.shuffle(valid_files)
 
     for filename in valid_files:
-        song_path = os.path.join(MUSIC_FOLDER, filename)
-        song_queue.append(song_path)
+        song_queue.append(registry.entry(registry.id_of(filename)))
 
     await ctx.send(f"🌌 {len(valid_files)} songs shimmered into your queue from the void.")
 
@@ -959,51 +3650,27 @@ async def playalluploads(ctx):
 async def deleteupload(ctx, *numbers):
     """Deletes one or multiple uploaded songs by their numbers (from !listsongs)."""
     guild_id = ctx.guild.id
-    uploaded_files = uploaded_files_by_guild.get(guild_id, [])
-    file_tags = file_tags_by_guild.get(guild_id, {})
-    song_queue = song_queue_by_guild.get(guild_id, [])
+    registry = track_registry_by_guild[guild_id]
 
     if not numbers:
         await ctx.send("🌙 Whisper a number or two — I need to know which songs to let go.")
         return
 
-    deleted = []
+    # Resolve every number against today's numbering before anything moves
+    doomed = {}
     invalid = []
-
     for num_str in numbers:
         try:
-            num = int(num_str.strip(','))
-            if 1 <= num <= len(uploaded_files):
-                filename = uploaded_files[num - 1]
-                file_path = os.path.join(MUSIC_FOLDER, filename)
-
-                # Delete the file if it exists
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        print(f"[Warning] Could not delete {filename}: {e}")
-
-                # Remove from queue if present
-                song_queue[:] = [s for s in song_queue if not s.endswith(filename)]
-
-                deleted.append(filename)
-            else:
-                invalid.append(num_str)
+            track_id = registry.at(int(num_str.strip(',')))
         except ValueError:
+            track_id = None
+        if track_id is None:
             invalid.append(num_str)
+        else:
+            doomed[track_id] = None
 
-    # Remove metadata
-    for filename in deleted:
-        if filename in uploaded_files:
-            uploaded_files.remove(filename)
-        file_tags.pop(filename, None)
-
-    # Save state
-    uploaded_files_by_guild[guild_id] = uploaded_files
-    file_tags_by_guild[guild_id] = file_tags
-    song_queue_by_guild[guild_id] = song_queue
-    save_upload_data()
+    # Then drop them all in one pass, from the library and the queue alike
+    deleted = forget_uploads(guild_id, doomed)
 
     if deleted:
         await ctx.send(
@@ -1018,9 +3685,8 @@ async def deleteupload(ctx, *numbers):
 async def clearuploads(ctx):
     """Deletes all uploaded files for this server to free space, with confirmation."""
     guild_id = ctx.guild.id
-    uploaded_files = uploaded_files_by_guild.get(guild_id, [])
 
-    if not uploaded_files:
+    if not track_registry_by_guild[guild_id]:
         await ctx.send("🌙 All is already still — no uploads to release.")
         return
 
@@ -1038,18 +3704,13 @@ async def clearuploads(ctx):
                 return
 
             file_count = 0
-            for filename in uploaded_files_by_guild[guild_id]:
-                file_path = os.path.join(MUSIC_FOLDER, filename)
-                if os.path.exists(file_path) and filename.lower().endswith(('.mp3', '.wav')):
-                    try:
-                        os.remove(file_path)
-                        file_count += 1
-                    except Exception as e:
-                        print(f"[Warning] Failed to delete {filename}: {e}")
+            for filename in track_registry_by_guild[guild_id].clear():
+                if filename.lower().endswith(('.mp3', '.wav')) and remove_upload_files(guild_id, filename):
+                    file_count += 1
 
-            uploaded_files_by_guild[guild_id] = []
-            file_tags_by_guild[guild_id] = {}
-            save_upload_data()
+            tag_index_by_guild[guild_id] = TagIndex()
+            track_meta_by_guild[guild_id] = {}
+            save_upload_data(guild_id)
 
             await interaction.response.edit_message(
                 content=f"💫 Released {file_count} file{'s' if file_count != 1 else ''}. The echoes are now adrift.",
@@ -1080,8 +3741,8 @@ async def clearuploads(ctx):
 async def tag(ctx, *args):
     """Tags uploaded songs with custom labels. Usage: !tag <number(s)> <tags>"""
     guild_id = ctx.guild.id
-    uploaded_files = uploaded_files_by_guild.get(guild_id, [])
-    file_tags = file_tags_by_guild.setdefault(guild_id, {})
+    registry = track_registry_by_guild[guild_id]
+    tag_index = tag_index_by_guild[guild_id]
 
     if len(args) < 2:
         await ctx.send("🏷️ Usage: `!tag <numbers> <tags>` — e.g., `!tag 1 3 chill ambient` to mark your sonic stars.")
@@ -1102,30 +3763,28 @@ async def tag(ctx, *args):
 
     tagged = []
     for num in numbers:
-        if 1 <= num <= len(uploaded_files):
-            filename = uploaded_files[num - 1]
-            file_tags.setdefault(filename, [])
-            for tag in tags:
-                if tag not in file_tags[filename]:
-                    file_tags[filename].append(tag)
+        track_id = registry.at(num)
+        if track_id is not None:
+            filename = registry.filename(track_id)
+            tag_index.add(filename, tags)
             tagged.append(filename)
         else:
             await ctx.send(f"🌘 Song number `{num}` drifts beyond this playlist... skipping.")
 
     if tagged:
         await ctx.send(f"🌠 Tagged: **{', '.join(tagged)}** with `{', '.join(tags)}`")
-        save_upload_data()
+        save_upload_data(guild_id)
     else:
         await ctx.send("🌫️ No songs were tagged — check your numbers and try again.")
 
 @bot.command(aliases=["tagplay", "greenflag", "pt"])
 async def playbytag(ctx, *search_tags):
-    """Plays all uploaded songs that match one or more tags. Usage: !playbytag chill vibe"""
+    """Plays all uploaded songs that match one or more tags. Usage: !playbytag chill vibe +lofi -sad"""
     guild_id = ctx.guild.id
-    uploaded_files = uploaded_files_by_guild.setdefault(guild_id, [])
-    file_tags = file_tags_by_guild.setdefault(guild_id, {})
+    registry = track_registry_by_guild[guild_id]
+    tag_index = tag_index_by_guild[guild_id]
 
-    if not uploaded_files:
+    if not registry:
         await ctx.send("🌑 There are no songs in the archive yet... cast your first star.")
         return
 
@@ -1133,20 +3792,26 @@ async def playbytag(ctx, *search_tags):
         await ctx.send("🌠 Whisper one or more tags. Example: `!playbytag ambient drift`")
         return
 
-    tags_lower = {tag.lower() for tag in search_tags}
+    # Plain tags match any, +tag must be present, -tag must be absent
+    any_of, all_of, none_of = [], [], []
+    for term in search_tags:
+        term = term.lower()
+        if term.startswith("+") and len(term) > 1:
+            all_of.append(term[1:])
+        elif term.startswith("-") and len(term) > 1:
+            none_of.append(term[1:])
+        else:
+            any_of.append(term)
+    tags_lower = [term.lower() for term in search_tags]
 
-    matched = [
-        filename for filename in uploaded_files
-        if file_tags.get(filename) and any(tag in file_tags[filename] for tag in tags_lower)
-    ]
+    matched = tag_index.query(any_of, all_of, none_of, universe=registry)
 
     if not matched:
         await ctx.send(f"🌘 No songs aligned with `{', '.join(tags_lower)}` — the night remains still.")
         return
 
     for filename in matched:
-        song_path = os.path.join(MUSIC_FOLDER, filename)
-        song_queue_by_guild[guild_id].append(song_path)
+        get_player(ctx.guild).queue.append(registry.entry(registry.id_of(filename)))
 
     await ctx.send(f"🌌 Added **{len(matched)}** songs shimmering with `{', '.join(tags_lower)}`.")
 
@@ -1161,9 +3826,7 @@ async def playbytag(ctx, *search_tags):
 async def listtags(ctx):
     """Shows all tags currently in use for uploaded songs (per-server)."""
     guild_id = ctx.guild.id
-    file_tags = file_tags_by_guild.setdefault(guild_id, {})
-
-    unique_tags = {tag for tags in file_tags.values() for tag in tags}
+    unique_tags = tag_index_by_guild[guild_id].all_tags()
 
     if not unique_tags:
         await ctx.send("🌫️ No tags exist yet — nothing is dancing in the air.")
@@ -1192,8 +3855,8 @@ async def listtags(ctx):
 async def removetag(ctx, *args):
     """Removes all tags from specified songs, or removes a specific tag from all songs."""
     guild_id = ctx.guild.id
-    file_tags = file_tags_by_guild.setdefault(guild_id, {})
-    uploaded_files = uploaded_files_by_guild.setdefault(guild_id, [])
+    tag_index = tag_index_by_guild[guild_id]
+    listing = track_registry_by_guild[guild_id].snapshot()  # numbers as they were when asked
 
     if not args:
         embed = discord.Embed(
@@ -1222,12 +3885,10 @@ async def removetag(ctx, *args):
 
         cleared = []
         for num in numbers:
-            if 1 <= num <= len(uploaded_files):
-                filename = uploaded_files[num - 1]
-                if filename in file_tags and file_tags[filename]:
-                    file_tags[filename] = []
-                    cleared.append(filename)
-                    did_change = True
+            filename = track_registry_by_guild[guild_id].filename(listing[num - 1]) if 1 <= num <= len(listing) else None
+            if filename and tag_index.clear(filename):
+                cleared.append(filename)
+                did_change = True
 
         if cleared:
             shown = ", ".join(cleared[:10]) + (", ..." if len(cleared) > 10 else "")
@@ -1255,15 +3916,8 @@ async def removetag(ctx, *args):
 
     else:
         tag_to_remove = args[0].lower()
-        removed_from = []
-
-        for filename, tags in file_tags.items():
-            tags_lowered = [t.lower() for t in tags]
-            if tag_to_remove in tags_lowered:
-                index = tags_lowered.index(tag_to_remove)
-                tags.pop(index)
-                removed_from.append(filename)
-                did_change = True
+        removed_from = tag_index.remove_tag(tag_to_remove)
+        did_change = bool(removed_from)
 
         if removed_from:
             shown = ", ".join(removed_from[:10]) + (", ..." if len(removed_from) > 10 else "")
@@ -1283,7 +3937,7 @@ async def removetag(ctx, *args):
         await loading_message.edit(content=None, embed=embed)
 
     if did_change:
-        save_upload_data()
+        save_upload_data(guild_id)
 
-load_upload_data()
-bot.run(TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    bot.run(TOKEN)
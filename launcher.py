@@ -0,0 +1,147 @@
+"""Runs EchoMond as several worker processes, each holding a range of shards.
+
+Every worker is a plain `python bot.py` with SHARD_COUNT, SHARD_IDS,
+WORKER_ID and WORKER_COUNT set, so each one owns its guilds outright:
+players, queues and library state never cross a process boundary, and every
+core gets its own interpreter (and GIL) for voice, ffmpeg supervision and
+gateway traffic. Workers share the blob store and the library on disk, which
+lock for that. The audio cache is not shared: each worker keeps its own
+folder under downloads/cache/ with 1/WORKER_COUNT of its budget.
+
+The shard count defaults to Discord's recommendation. Workers start
+staggered so their IDENTIFYs respect the session start limit, and a worker
+that dies is restarted with backoff.
+
+Usage: python launcher.py [--workers N] [--shards N]
+Environment: TOKEN, plus optional WORKER_PROCESSES and SHARD_COUNT.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+IDENTIFY_INTERVAL = 5.0  # seconds per identify bucket, per Discord's gateway rules
+RESTART_BACKOFF_MAX = 60.0
+
+
+def recommended_shards(token):
+    """Asks the gateway how many shards to run and how many may identify at once."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "EchoMond launcher"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        data = json.load(response)
+    return data["shards"], data.get("session_start_limit", {}).get("max_concurrency", 1)
+
+
+def shard_ranges(shard_count, workers):
+    """Splits shards 0..shard_count-1 into contiguous, near-equal ranges."""
+    workers = max(1, min(workers, shard_count))
+    base, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for index in range(workers):
+        size = base + (1 if index < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+class Worker:
+    def __init__(self, worker_id, shard_ids, shard_count, worker_count):
+        self.worker_id = worker_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.worker_count = worker_count
+        self.process = None
+        self.backoff = 1.0
+        self.started_at = 0.0
+        self.restart_at = None  # monotonic deadline for the next start after a crash
+
+    def start(self):
+        env = dict(
+            os.environ,
+            SHARD_COUNT=str(self.shard_count),
+            SHARD_IDS=",".join(map(str, self.shard_ids)),
+            WORKER_ID=str(self.worker_id),
+            WORKER_COUNT=str(self.worker_count),
+        )
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+        self.process = subprocess.Popen([sys.executable, script], env=env)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        print(f"[Launcher] 🚀 Worker {self.worker_id} (pid {self.process.pid}) → shards "
+              f"{self.shard_ids[0]}–{self.shard_ids[-1]} of {self.shard_count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=int(os.getenv("SHARD_COUNT", "0")))
+    args = parser.parse_args()
+
+    token = os.getenv("TOKEN")
+    if not token:
+        sys.exit("[Launcher] TOKEN is not set.")
+    shard_count, max_concurrency = args.shards, 1
+    if not shard_count:
+        shard_count, max_concurrency = recommended_shards(token)
+
+    ranges = shard_ranges(shard_count, args.workers)
+    workers = [Worker(index, shards, shard_count, len(ranges)) for index, shards in enumerate(ranges)]
+    print(f"[Launcher] 🌌 {shard_count} shard(s) across {len(workers)} worker(s).")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for worker in workers:
+            if worker.process and worker.process.poll() is None:
+                worker.process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Each worker identifies its shards one bucket at a time; wait that long before the next worker starts
+    for worker in workers:
+        if stopping:
+            break
+        worker.start()
+        time.sleep(len(worker.shard_ids) * IDENTIFY_INTERVAL / max_concurrency)
+
+    # One tick a second: crashed workers get a restart deadline instead of a sleep, so every exit is noticed
+    while not stopping:
+        time.sleep(1)
+        now = time.monotonic()
+        for worker in workers:
+            if stopping:
+                break
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    worker.start()
+                continue
+            code = worker.process.poll()
+            if code is None:
+                continue
+            if now - worker.started_at > RESTART_BACKOFF_MAX:
+                worker.backoff = 1.0  # it ran a good while; this isn't a crash loop
+            print(f"[Launcher] 💥 Worker {worker.worker_id} exited with {code}; restarting in {worker.backoff:.0f}s.")
+            worker.restart_at = now + worker.backoff
+            worker.backoff = min(worker.backoff * 2, RESTART_BACKOFF_MAX)
+
+    # A worker spawned just as the signal arrived never got it; make sure every live one has
+    for worker in workers:
+        if worker.process and worker.process.poll() is None:
+            worker.process.send_signal(signal.SIGTERM)
+    for worker in workers:
+        if worker.process:
+            worker.process.wait()
+
+
+if __name__ == "__main__":
+    main()
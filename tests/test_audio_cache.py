@@ -0,0 +1,63 @@
+import importlib
+import os
+import sys
+import time
+
+import pytest
+
+for dependency in ("discord", "yt_dlp", "mutagen", "aiohttp"):
+    pytest.importorskip(dependency)
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIDEO_ID = "dQw4w9WgXcQ"
+
+
+@pytest.fixture(scope="module")
+def bot(tmp_path_factory):
+    """Imports bot.py from a scratch directory so its downloads/ lands there."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("echomond"))
+    sys.path.insert(0, REPO)
+    try:
+        yield importlib.import_module("bot")
+    finally:
+        sys.path.remove(REPO)
+        os.chdir(cwd)
+
+
+def age(folder, seconds):
+    then = time.time() - seconds
+    for name in os.listdir(folder):
+        os.utime(os.path.join(folder, name), (then, then))
+
+
+def test_entry_survives_restart(bot, tmp_path):
+    folder = str(tmp_path)
+    cache = bot.AudioCache(folder, bot.AUDIO_CACHE_FORMAT, 10 ** 9, 100)
+    audio = tmp_path / f"{VIDEO_ID}.{bot.AUDIO_CACHE_FORMAT}.webm"
+    audio.write_bytes(b"\0" * 1024)
+    cache.add(VIDEO_ID, str(audio), "Starlight", 212)
+    age(folder, 2 * bot.AUDIO_CACHE_ORPHAN_GRACE)  # old enough to be deleted if it looked orphaned
+
+    restarted = bot.AudioCache(folder, bot.AUDIO_CACHE_FORMAT, 10 ** 9, 100)
+    restarted.reconcile()
+
+    entry = restarted.get(VIDEO_ID)
+    assert entry is not None
+    assert entry["path"] == str(audio)
+    assert (entry["title"], entry["duration"], entry["size"]) == ("Starlight", 212, 1024)
+    assert restarted.total_bytes == 1024
+    assert sorted(os.listdir(folder)) == sorted([audio.name, f"{VIDEO_ID}.{bot.AUDIO_CACHE_FORMAT}.json"])
+
+
+def test_reconcile_drops_old_orphans(bot, tmp_path):
+    folder = str(tmp_path)
+    (tmp_path / f"{VIDEO_ID}.{bot.AUDIO_CACHE_FORMAT}.json").write_text('{"title": "Gone", "duration": 1}')
+    (tmp_path / f"aaaaaaaaaaa.{bot.AUDIO_CACHE_FORMAT}.webm").write_bytes(b"\0")
+    age(folder, 2 * bot.AUDIO_CACHE_ORPHAN_GRACE)
+
+    cache = bot.AudioCache(folder, bot.AUDIO_CACHE_FORMAT, 10 ** 9, 100)
+    cache.reconcile()
+
+    assert len(cache.entries) == 0
+    assert os.listdir(folder) == []